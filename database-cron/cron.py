@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+# cron_utils first, it puts the shared database code on sys.path
+from cron_utils import (
+    serve_metrics,
+    wait_for_schema
+)
+from job_utils import (
+    JobRunner,
+    add_jobs
+)
+import signal
+
+# export and retention out of the ingest process: same file, same code, same schedule. the ingest
+# process runs with JOBS='cron' and keeps the write lock to itself except for the export cursor and
+# outbox updates and clear_local's short delete transactions; everything else here only reads, which
+# in WAL mode never blocks the writer
+
+def main():
+    print(f'initilizing...')
+
+    runner = JobRunner({})
+    for signum in [signal.SIGTERM, signal.SIGINT]:
+        signal.signal(signum, lambda signum, frame: runner.stopping.set())
+
+    if wait_for_schema(runner.stopping):
+        server = serve_metrics()
+        add_jobs(runner)
+
+        print(f'\ninitilizing completed!')
+
+        runner.run()
+        server.shutdown()
+
+    # running jobs stop after their current batch
+    print('shutdown started')
+    runner.stop()
+    print('shutdown completed')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+# the code and constants are shared with the ingest process: ../database, mounted at /usr/src/database
+DATABASE_DIR = os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..', 'database'))
+sys.path.insert(0, DATABASE_DIR)
+
+from constants import (
+    CRON_PORT,
+    CRON_SCHEMA_POLL_SECONDS,
+    DATABASE_FILE
+)
+from db_utils import (
+    MIGRATIONS,
+    get_db_conn,
+    get_user_version
+)
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from stats_utils import render as render_stats
+import threading
+
+def wait_for_schema(stopping, db_file = DATABASE_FILE, poll_seconds = CRON_SCHEMA_POLL_SECONDS):
+    # the ingest process creates and migrates the file (it is the only one that does), jobs start
+    # once it is current; False when stopped first
+    while not stopping.is_set():
+        if os.path.exists(db_file):
+            db_conn = get_db_conn(db_file=db_file, read_only=True)
+            try:
+                user_version = get_user_version(db_conn)
+            finally:
+                db_conn.close()
+
+            if user_version >= len(MIGRATIONS):
+                return True
+            print(f'wait_for_schema user_version: {user_version}/{len(MIGRATIONS)}')
+        else:
+            print(f'wait_for_schema waiting for: {db_file}')
+
+        stopping.wait(poll_seconds)
+
+    return False
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/prometheus':
+            self.send_error(404)
+            return
+
+        body = render_stats().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_metrics(port = CRON_PORT):
+    # job and export metrics of this process, the ingest process serves its own on FLASK_PORT
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+
+    return server
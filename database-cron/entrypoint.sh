@@ -1,11 +1,6 @@
 #!/bin/sh
 
-# Start the run once job.
 echo "Docker container has been started"
 
-# Setup a cron schedule
-echo "* * * * * /usr/local/bin/python3 /usr/src/database-cron/publish-remote.py >> /var/log/cron-publish-remote.log 2>&1
-# This extra line makes it a valid cron" > scheduler.txt
-
-crontab scheduler.txt
-crond -f -l 2
+# exec, so docker stop's SIGTERM reaches the job runner and running jobs end cleanly
+exec python -u /usr/src/database-cron/cron.py
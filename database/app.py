@@ -1,36 +1,83 @@
 #!/usr/bin/env python3
 
-from aws_utils import (
-    get_aws_write_client,
-    prepare_common_attributes,
-    prepare_measure,
-    print_rejected_records_exceptions
+from archive_utils import (
+    get_oldest_ms,
+    iter_archive_chunks
 )
 from constants import (
     DATABASE_FILE,
-    DATABASE_NAME,
+    DEADBAND,
+    DEADBAND_MAX_GAP_SECONDS,
+    DEFAULT_HOST,
+    FLASK_DEBUG,
     FLASK_PORT,
-    MAX_RECORDS_PER_WRITE,
+    FLASK_SERVER,
+    FLASK_THREADS,
+    JOBS,
     MQTT_HOST,
     MQTT_KEEPALIVE,
     MQTT_PORT,
-    PC_PUBLISH_TOPIC,
-    SENSOR_NAMES_SET,
-    SORTED_SENSORS_LIST,
+    SQLITE_SAMPLES_COLUMNS,
     SQLITE_TABLE_NAME,
-    TABLE_NAME,
+    STREAM_CHUNK_ROWS,
     TOPIC
 )
 from datetime import datetime
-from flask import Flask, request
-from thread_utils import run_threaded
+from deadband_utils import (
+    Deadband,
+    get_window_ms
+)
+from db_utils import (
+    ReadPool,
+    get_insert_sql,
+    get_since_ms,
+    init_sql_table
+)
+from filter_utils import resolve_sensors
+from flask import Flask, Response, request
+from job_utils import (
+    JobRunner,
+    add_jobs
+)
+from live_utils import (
+    Broadcaster,
+    iter_events
+)
+from response_utils import (
+    MIMETYPES,
+    encode_dicts,
+    get_columns,
+    stream_query
+)
+from retention_utils import get_archive_pending
+from ring_utils import RingBuffer
+from rollup_utils import (
+    parse_agg,
+    query_aggregated
+)
+from router_utils import TopicRouter
+from stats_utils import (
+    MESSAGE_SECONDS,
+    MESSAGES,
+    QUERY_SECONDS,
+    Gauge,
+    iter_timed,
+    render as render_stats
+)
+from worker_utils import MessageWorkers
+from writer_utils import BatchWriter
 import json
 import paho.mqtt.client as mqtt
-import schedule
-import sqlite3
+import signal
 import threading
 import time
 
+# production server, app.py falls back to the development server without it
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
 FLASK_APP = Flask(__name__)
 
 def on_connect(client, userdata, flags, rc):
@@ -38,93 +85,39 @@ def on_connect(client, userdata, flags, rc):
 
     client.subscribe(TOPIC)
 
-def on_disconnect(client):
+def on_disconnect(client, userdata, rc):
     print('Disconnected')
 
 def on_message(client, userdata, msg):
-    topic = msg.topic
+    # runs on the paho network thread, decoding happens on the message workers
+    MESSAGES.inc()
+    userdata['workers'].put(msg.topic, msg.payload)
 
-    if topic == PC_PUBLISH_TOPIC:
-        message=msg.payload.decode('utf-8')
-        
-        payloadJson = json.loads(message)
-        timestamp = payloadJson['sent']
-        delimitter = payloadJson['delimitter']
-        sensors = payloadJson['payload']
-        
-        print(f'Message with topic "{topic}" received at: {timestamp}')
-        # json_formatted_str = json.dumps(payloadJson, indent=4)
-        # print(f'message received at: {timestamp}. {json_formatted_str}')
+def handle_message(userdata, topic, payload):
+    decoder = userdata['router'].get(topic)
 
-        db_conn = userdata['db_conn']
-        
-        sensorsDict = dict.fromkeys(SENSOR_NAMES_SET, -1)
-        
-        for each in sensors:
-            key = each['Id']
-            value = each['Value']
-            
-            if key in sensorsDict:
-                sensorsDict[key] = value
-        
-        cols = ', '.join(SORTED_SENSORS_LIST)
-        vals = map(lambda col: ':' + col, SORTED_SENSORS_LIST)
-        vals = ', '.join(vals)
+    if decoder is not None:
+        started = time.perf_counter()
+        row = decoder.decode(payload)
+        timestamp = row[0]
         
-        sql = f"""INSERT INTO {SQLITE_TABLE_NAME}
-            (
-                timestamp,
-                {cols}
-            ) VALUES
-            (
-                :timestamp,
-                {vals}
-            )
-        """
-
-        sensorsDict['timestamp'] = timestamp
+        print(f'Message with topic "{topic}" received at: {timestamp}')
         
-        cursor = db_conn.cursor()
-        cursor.execute(sql, sensorsDict)
-        db_conn.commit()
-        cursor.close()
+        userdata['ring_buffers'][decoder.host].append(row)
+        userdata['broadcaster'].publish(decoder.host, row)
+
+        deadband = userdata['deadbands'].get(topic)
+        if deadband is None:
+            userdata['writer'].put(row, decoder.sql)
+        else:
+            stored = deadband.put(row)
+            if stored is not None:
+                userdata['writer'].put(stored, deadband.sql)
+        MESSAGE_SECONDS.observe(time.perf_counter() - started)
     else:
         utc = datetime.utcnow()
         print(f'Message with topic "{topic}" received at {utc} does not have any handler')
 
-def get_db_conn(use_row = False):
-    db_conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
-    
-    if use_row:
-        db_conn.row_factory = sqlite3.Row 
-    
-    return db_conn
-
-def init_sql_table():
-    print(f'init_sql_table started')
-    cols = map(lambda col: col + ' REAL NOT NULL', SORTED_SENSORS_LIST)
-    sql = ', '.join(cols)
-
-    # Initialize SQLITE3
-    db_conn = get_db_conn()
-    sql = f"""
-        CREATE TABLE IF NOT EXISTS {SQLITE_TABLE_NAME} (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            {sql}
-        )
-    """
-    
-    cursor = db_conn.cursor()
-    cursor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE_NAME}')
-    cursor.execute(sql)
-    db_conn.commit()
-    cursor.close()
-    
-    print(f'init_sql_table completed')
-    
-    return db_conn
-
 def connect_mqtt(userdata):
     print('connect_mqtt started')
     client = mqtt.Client()
@@ -151,10 +144,20 @@ def connect_mqtt(userdata):
     
     print('connect_mqtt completed')
 
+    return client
+
 def init_flask(userdata):
-    print(f'init flask at port {FLASK_PORT}')
+    print(f'init flask at port {FLASK_PORT}, server: {FLASK_SERVER}')
+    
+    if FLASK_SERVER == 'waitress' and waitress is not None:
+        # request threads share this process's ring buffers, writer and read pool,
+        # each request borrows its own pooled SQLite connection
+        waitress.serve(FLASK_APP, host='0.0.0.0', port=FLASK_PORT, threads=FLASK_THREADS, ident=None)
+        return
     
-    FLASK_APP.run(host='0.0.0.0', port=FLASK_PORT, debug=True, use_reloader=False)
+    if FLASK_SERVER == 'waitress':
+        print('init_flask waitress is not installed, using the development server')
+    FLASK_APP.run(host='0.0.0.0', port=FLASK_PORT, debug=FLASK_DEBUG, use_reloader=False, threaded=True)
 
 @FLASK_APP.route('/metrics', methods = ['GET'])
 def index():
@@ -163,116 +166,201 @@ def index():
     filter_group = filter_group.lower()
     filter_sensor = request.args.get('sensor', default = '*', type = str)
     filter_sensor = filter_sensor.lower()
+    filter_step = request.args.get('step', default = 0, type = int)
+    filter_agg = request.args.get('agg', default = 'avg', type = str)
+    filter_agg = filter_agg.lower()
+    filter_format = request.args.get('format', default = 'json', type = str)
+    filter_format = filter_format.lower()
+    filter_host = request.args.get('host', default = DEFAULT_HOST, type = str)
 
-    db_conn = get_db_conn(True)
-    sql = f"SELECT * FROM {SQLITE_TABLE_NAME} WHERE timestamp >= datetime('now', '-{filter_minutes} minute')"
-    cursor = db_conn.cursor()
-    cursor.execute(sql)
-    rows = cursor.fetchall()
-    cursor.close()
-    
-    json_string = json.dumps([dict(row) for row in rows]) 
-    return json_string
+    if filter_format not in MIMETYPES:
+        return json.dumps({'error': f'unsupported format: {filter_format}'}), 400
+    mimetype = MIMETYPES[filter_format]
 
-def write_records(rows):
-    write_client = get_aws_write_client()
+    host = userdata['router'].get_host(filter_host)
+    if host is None:
+        return json.dumps({'error': f'unknown host: {filter_host}'}), 400
 
-    if (write_client is None): return
-    
-    records = []
+    # only known sensor columns ever reach the SQL
+    cols, unknown = resolve_sensors(filter_group, filter_sensor)
+    if len(unknown) > 0:
+        return json.dumps({'error': f'unknown group or sensor: {", ".join(unknown)}'}), 400
 
-    for row in rows:
-        sqlite_id, timestamp, *rest = row
+    since_ms = get_since_ms(filter_minutes)
+    columns = get_columns(cols)
+    
+    if filter_step > 0:
+        if parse_agg(filter_agg)[0] is None:
+            return json.dumps({'error': f'unsupported agg: {filter_agg}'}), 400
+        if DEADBAND and filter_step % DEADBAND_MAX_GAP_SECONDS != 0:
+            # a stored row stands for the messages of its whole window, smaller buckets would only see it in one
+            return json.dumps({'error': f'step must be a multiple of {DEADBAND_MAX_GAP_SECONDS} with the deadband on'}), 400
         
-        dt_obj = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S.%f')
-        time = int(round(dt_obj.timestamp() * 1000))
+        with QUERY_SECONDS['aggregated'].time():
+            with userdata['read_pool'].connection() as db_conn:
+                rows = query_aggregated(db_conn, since_ms, filter_step * 1000, filter_agg, cols, host)
+            body = encode_dicts(rows, columns, filter_format)
         
-        record = {
-            'Time': str(time),
-            'MeasureValues': []
-        }
+        return Response(body, mimetype=mimetype)
+    
+    # recent windows come straight from memory, older ones are streamed from SQLite,
+    # anything older than the oldest local row from the archive files
+    started = time.perf_counter()
+    rows = userdata['ring_buffers'][host].query(since_ms, cols)
+    
+    if rows is None:
+        # a stored row stands for the later messages of its window too, the one holding since_ms starts before it
+        query_ms = get_window_ms(since_ms) if DEADBAND else since_ms
         
-        for index in range(len(SORTED_SENSORS_LIST)):
-            metric = SORTED_SENSORS_LIST[index]
-            value = rest[index]
-            measure = prepare_measure(metric, value)
-            
-            record['MeasureValues'].append(measure)
-              
-        records.append(record)
-
-    if (len(records) == 0):
-        print('write_records: no record to write')
-        return
-
-    print(f'write_records length: {len(records)}')    
-    print(f'write_records first: {records[0]}')
-    print(f'write_records last: {records[-1]}')
+        with userdata['read_pool'].connection() as db_conn:
+            oldest_ms = get_oldest_ms(db_conn, host)
+            pending = get_archive_pending(db_conn)
+        
+        # rows left out by the deadband are filled back in from the samples columns
+        archived = ()
+        if oldest_ms is None or query_ms < oldest_ms or (pending is not None and query_ms <= pending[1]):
+            archived = iter_archive_chunks(query_ms, get_since_ms(0), cols + SQLITE_SAMPLES_COLUMNS, STREAM_CHUNK_ROWS, host)
+        
+        sql = f"SELECT {', '.join(columns + SQLITE_SAMPLES_COLUMNS)} FROM {SQLITE_TABLE_NAME} WHERE host = ? AND time_ms >= ?"
+        params = (host, query_ms)
+        if pending is not None:
+            # rows clear_local archived and has not deleted yet are read from the archive only
+            sql += ' AND NOT (id < ? AND time_ms <= ?)'
+            params += pending
+        sql += ' ORDER BY time_ms'
+        
+        # rows still held by the deadband or queued in the writer come from the ring buffer
+        ring_buffer = userdata['ring_buffers'][host]
+        tail = lambda last_ms: ring_buffer.query_tail(last_ms + 1, cols)
+        stream = stream_query(userdata['read_pool'], sql, params, columns, filter_format, archived, fill=True, since_ms=since_ms, tail=tail)
+        
+        return Response(iter_timed(stream, QUERY_SECONDS['sqlite']), mimetype=mimetype)
     
-    # https://www.geeksforgeeks.org/break-list-chunks-size-n-python/
-    batches = [records[i * MAX_RECORDS_PER_WRITE:(i + 1) * MAX_RECORDS_PER_WRITE] for i in range((len(records) + MAX_RECORDS_PER_WRITE - 1) // MAX_RECORDS_PER_WRITE )]
+    body = encode_dicts(rows, columns, filter_format)
+    QUERY_SECONDS['memory'].observe(time.perf_counter() - started)
     
-    print(f'write_records batches: {len(batches)}.')
-    print('write_records started')
-    common_attributes = prepare_common_attributes()
-    for batch in batches: 
-        try:
-            result = write_client.write_records(
-                DatabaseName=DATABASE_NAME,
-                TableName=TABLE_NAME,
-                Records=batch,
-                CommonAttributes=common_attributes
-            )
-            print(f"write_recordsstatus: [{result['ResponseMetadata']['HTTPStatusCode']}]")
-        except write_client.exceptions.RejectedRecordsException as err:
-            print_rejected_records_exceptions(err)
-        except Exception as err:
-            print(f'write_records error: {err}')
-    print('write_records completed')
+    return Response(body, mimetype=mimetype)
 
-def run_threaded(job_func, userdata):
-    job_thread = threading.Thread(target=job_func, args=(userdata,))
-    job_thread.start()
-    
-def publish_remote(userdata):
-    print('publish_remote started')
-    db_conn = userdata['db_conn']
+@FLASK_APP.route('/live', methods = ['GET'])
+def live():
+    # Server-Sent Events, one event per ingested row with only the values that changed
+    filter_group = request.args.get('group', default = '*', type = str)
+    filter_group = filter_group.lower()
+    filter_sensor = request.args.get('sensor', default = '*', type = str)
+    filter_sensor = filter_sensor.lower()
+    filter_host = request.args.get('host', default = DEFAULT_HOST, type = str)
 
-    sql = f"SELECT * FROM {SQLITE_TABLE_NAME} WHERE timestamp >= datetime('now', '-1 hour')"
-    cursor = db_conn.cursor()
-    cursor.execute(sql)
-    
-    rows = cursor.fetchall()
-    cursor.close()
-    
-    print(f'numrows: {len(rows)}')
-    write_records(rows)
-    print('publish_remote completed')
+    host = userdata['router'].get_host(filter_host)
+    if host is None:
+        return json.dumps({'error': f'unknown host: {filter_host}'}), 400
+
+    cols, unknown = resolve_sensors(filter_group, filter_sensor)
+    if len(unknown) > 0:
+        return json.dumps({'error': f'unknown group or sensor: {", ".join(unknown)}'}), 400
+
+    subscriber = userdata['broadcaster'].subscribe(host, cols)
+    if subscriber is None:
+        return json.dumps({'error': 'too many live subscribers'}), 503
+
+    stream = iter_events(userdata['broadcaster'], subscriber)
+
+    return Response(stream, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@FLASK_APP.route('/stats', methods = ['GET'])
+def stats():
+    # backpressure of the ingest path: queue depths and drops
+    body = {
+        'workers': userdata['workers'].get_stats(),
+        'writer': userdata['writer'].get_stats()
+    }
+
+    return Response(json.dumps(body), mimetype='application/json')
+
+@FLASK_APP.route('/prometheus', methods = ['GET'])
+def prometheus():
+    return Response(render_stats(), mimetype='text/plain; version=0.0.4')
+
+def init_userdata(db_file = DATABASE_FILE):
+    db_conn = init_sql_table(db_file)
+    router = TopicRouter()
+    writer = BatchWriter(get_insert_sql(), db_file=db_file)
+    writer.start()
+    read_pool = ReadPool(db_file=db_file)
+    ring_buffers = {}
+    for host in router.hosts.values():
+        ring_buffers[host] = RingBuffer(host=host)
+        ring_buffers[host].load(db_conn)
+    broadcaster = Broadcaster()
+    deadbands = {}
+    if DEADBAND:
+        deadbands = {topic: Deadband(decoder.host) for topic, decoder in router.decoders.items()}
+    userdata={
+        'broadcaster': broadcaster,
+        'db_conn': db_conn,
+        'deadbands': deadbands,
+        'read_pool': read_pool,
+        'ring_buffers': ring_buffers,
+        'router': router,
+        'writer': writer
+    }
+    workers = MessageWorkers(handle_message, userdata)
+    workers.start()
+    userdata['workers'] = workers
+
+    Gauge('homestats_worker_queue_depth', 'Messages waiting for a message worker', lambda: workers.get_stats()['depth'])
+    Gauge('homestats_worker_dropped_total', 'Messages dropped because a worker queue was full', lambda: workers.dropped, kind='counter')
+    Gauge('homestats_writer_queue_depth', 'Rows waiting for the batch writer', lambda: writer.queue.qsize())
+    Gauge('homestats_writer_dropped_total', 'Rows dropped because the writer queue was full', lambda: writer.dropped, kind='counter')
+    Gauge('homestats_live_subscribers', 'Connected /live clients', lambda: len(broadcaster.subscribers))
+    Gauge('homestats_live_dropped', 'Rows dropped by slow /live clients still connected', broadcaster.get_dropped)
+
+    return userdata
+
+def shutdown(userdata, client, runner):
+    # SIGTERM (docker stop): everything received is written before the process exits
+    print('shutdown started')
+
+    client.disconnect()
+    client.loop_stop()
+    userdata['workers'].stop()
+
+    # rows the deadband still holds back
+    for deadband in userdata['deadbands'].values():
+        stored = deadband.flush()
+        if stored is not None:
+            userdata['writer'].put(stored, deadband.sql)
+    userdata['writer'].stop()
+
+    runner.stop()
+    userdata['db_conn'].close()
+
+    print('shutdown completed')
+
+# set by main(), the routes read it
+userdata = None
+
+def main():
+    global userdata
+
+    print(f'initilizing...')
 
-def clear_local(userdata):
-    print('clear_local started')
-    db_conn = userdata['db_conn']
-    sql = f"DELETE FROM {SQLITE_TABLE_NAME} WHERE timestamp <= datetime('now','-2 days')"
-    cursor = db_conn.cursor()
-    cursor.execute(sql)
-    print(f'clear_local total: {cursor.rowcount}')
-    db_conn.commit()
-    cursor.close()
-    print('clear_local completed')
+    userdata = init_userdata()
 
-print(f'initilizing...')
+    client = connect_mqtt(userdata)
+    threading.Thread(target=init_flask, args=(userdata,), name='flask', daemon=True).start()
 
-db_conn = init_sql_table()
-userdata={'db_conn': db_conn}
+    print(f'\ninitilizing completed!')
 
-connect_mqtt(userdata)
-run_threaded(init_flask, userdata=userdata)
+    # with JOBS='cron' export and retention run in database-cron, the runner only waits for a signal
+    runner = JobRunner(userdata)
+    if JOBS == 'app':
+        add_jobs(runner)
 
-print(f'\ninitilizing completed!')
+    for signum in [signal.SIGTERM, signal.SIGINT]:
+        signal.signal(signum, lambda signum, frame: runner.stopping.set())
 
-schedule.every(1).hours.do(run_threaded, publish_remote, userdata=userdata)
-schedule.every(1).days.do(run_threaded, clear_local, userdata=userdata)
+    runner.run()
+    shutdown(userdata, client, runner)
 
-while True:
-    schedule.run_pending()
-    time.sleep(1)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+from array import array
+from bisect import bisect_left
+from constants import (
+    ARCHIVE_DIR,
+    DEFAULT_HOST,
+    SENSOR_MISSING_VALUE,
+    SORTED_SENSORS_LIST,
+    SQLITE_SAMPLES_COLUMNS,
+    SQLITE_TABLE_NAME
+)
+import itertools
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+# one file per host, UTC day and clear_local run: <ARCHIVE_DIR>/<host>/<table>-<YYYY-MM-DD>.<first id>.hsa
+#   b'HSA1', uint32 header length, JSON header, then one zlib block per column
+# time_ms is delta encoded, sensor columns are byte-shuffled doubles (the Blosc trick: the
+# sign/exponent bytes of slowly varying values line up and compress well)
+ARCHIVE_MAGIC = b'HSA1'
+ARCHIVE_SUFFIX = '.hsa'
+ARCHIVE_COLUMNS = SORTED_SENSORS_LIST + SQLITE_SAMPLES_COLUMNS
+# read for a column the file does not have: a sensor added later, or samples from before the deadband
+ARCHIVE_DEFAULTS = {'samples': 1, 'span_ms': 0}
+DAY_MS = 24 * 60 * 60 * 1000
+
+def shuffle(raw, width = 8):
+    return b''.join(raw[index::width] for index in range(width))
+
+def unshuffle(shuffled, width = 8):
+    count = len(shuffled) // width
+    raw = bytearray(len(shuffled))
+    for index in range(width):
+        raw[index::width] = shuffled[index * count:(index + 1) * count]
+
+    return raw
+
+def get_day(time_ms):
+    return time.strftime('%Y-%m-%d', time.gmtime(time_ms // 1000))
+
+def format_timestamps(times):
+    # strftime only once per minute, it is most of the cost of a scan otherwise
+    timestamps = []
+    minute = None
+    prefix = None
+
+    for time_ms in times:
+        seconds, millis = divmod(time_ms, 1000)
+        if seconds // 60 != minute:
+            minute = seconds // 60
+            prefix = time.strftime('%Y-%m-%d %H:%M:', time.gmtime(minute * 60))
+        timestamps.append('%s%02d.%03d' % (prefix, seconds % 60, millis))
+
+    return timestamps
+
+def write_archive(path, times, columns):
+    deltas = array('q', [times[0]] + [times[i] - times[i - 1] for i in range(1, len(times))])
+    blocks = [('time_ms', zlib.compress(deltas.tobytes()))]
+    for col, values in columns.items():
+        blocks.append((col, zlib.compress(shuffle(values.tobytes()))))
+
+    offsets = {}
+    offset = 0
+    for name, block in blocks:
+        offsets[name] = [offset, len(block)]
+        offset += len(block)
+
+    header = json.dumps({
+        'count': len(times),
+        'first_ms': min(times),
+        'last_ms': max(times),
+        'blocks': offsets
+    }).encode('utf-8')
+
+    # written next to the target and renamed, so a crash never leaves a partial archive behind
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(ARCHIVE_MAGIC + struct.pack('<I', len(header)) + header)
+        for _, block in blocks:
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class ArchiveFile:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mm[:4] != ARCHIVE_MAGIC:
+            raise ValueError(f'not an archive file: {path}')
+
+        header_length = struct.unpack('<I', self.mm[4:8])[0]
+        self.header = json.loads(self.mm[8:8 + header_length].decode('utf-8'))
+        self.data_offset = 8 + header_length
+
+    def read_block(self, name):
+        offset, length = self.header['blocks'][name]
+        start = self.data_offset + offset
+
+        return zlib.decompress(self.mm[start:start + length])
+
+    def read_times(self):
+        deltas = array('q')
+        deltas.frombytes(self.read_block('time_ms'))
+
+        return list(itertools.accumulate(deltas))
+
+    def read_column(self, col):
+        values = array('d')
+
+        if col not in self.header['blocks']:
+            values.extend([float(ARCHIVE_DEFAULTS.get(col, SENSOR_MISSING_VALUE))] * self.header['count'])
+        else:
+            values.frombytes(unshuffle(self.read_block(col)))
+
+        return values
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+def get_archive_paths(since_ms, until_ms, host = DEFAULT_HOST, archive_dir = ARCHIVE_DIR):
+    archive_dir = os.path.join(archive_dir, host)
+    if not os.path.isdir(archive_dir):
+        return []
+
+    first_day = get_day(since_ms)
+    last_day = get_day(until_ms)
+    prefix = f'{SQLITE_TABLE_NAME}-'
+
+    paths = []
+    for name in os.listdir(archive_dir):
+        if not name.startswith(prefix) or not name.endswith(ARCHIVE_SUFFIX):
+            continue
+
+        day, first_id = name[len(prefix):-len(ARCHIVE_SUFFIX)].split('.')
+        if first_day <= day <= last_day:
+            paths.append((day, int(first_id), os.path.join(archive_dir, name)))
+
+    return [path for _, _, path in sorted(paths)]
+
+def has_archive(host = DEFAULT_HOST, archive_dir = ARCHIVE_DIR):
+    archive_dir = os.path.join(archive_dir, host)
+    if not os.path.isdir(archive_dir):
+        return False
+
+    return any(name.endswith(ARCHIVE_SUFFIX) for name in os.listdir(archive_dir))
+
+def get_oldest_ms(db_conn, host = DEFAULT_HOST):
+    cursor = db_conn.cursor()
+    cursor.execute(f'SELECT min(time_ms) FROM {SQLITE_TABLE_NAME} WHERE host = ?', (host,))
+    oldest_ms = cursor.fetchone()[0]
+    cursor.close()
+
+    return oldest_ms
+
+def archive_rows(db_conn, cutoff_ms, before_id, archive_dir = ARCHIVE_DIR):
+    # compacts every row clear_local is about to delete (time_ms <= cutoff_ms and id < before_id),
+    # one part file per host and UTC day; the caller deletes the rows once this returns. a part is named
+    # after its first id, so running again after a crash before the delete rewrites the same files; once
+    # the delete started, clear_local finishes it without archiving again (see retention_utils.py)
+    cursor = db_conn.cursor()
+    cursor.execute(f'SELECT DISTINCT host FROM {SQLITE_TABLE_NAME} WHERE time_ms <= ? AND id < ?', (cutoff_ms, before_id))
+    hosts = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+
+    return sum(archive_host_rows(db_conn, host, cutoff_ms, before_id, archive_dir) for host in hosts)
+
+def archive_host_rows(db_conn, host, cutoff_ms, before_id, archive_dir):
+    cols = ', '.join(ARCHIVE_COLUMNS)
+    sql = f"""
+        SELECT id, time_ms, {cols} FROM {SQLITE_TABLE_NAME}
+        WHERE host = ? AND time_ms <= ? AND id < ? AND time_ms >= ? AND time_ms < ?
+        ORDER BY time_ms
+    """
+    archive_dir = os.path.join(archive_dir, host)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    cursor = db_conn.cursor()
+    cursor.execute(f"""
+        SELECT min(time_ms) FROM {SQLITE_TABLE_NAME}
+        WHERE host = ? AND time_ms <= ? AND id < ?
+    """, (host, cutoff_ms, before_id))
+    first_ms = cursor.fetchone()[0]
+    cursor.close()
+
+    total = 0
+    day_ms = first_ms - first_ms % DAY_MS if first_ms is not None else cutoff_ms + 1
+    while day_ms <= cutoff_ms:
+        first_id = None
+        times = array('q')
+        columns = {col: array('d') for col in ARCHIVE_COLUMNS}
+        values = list(columns.values())
+
+        cursor = db_conn.cursor()
+        cursor.execute(sql, (host, cutoff_ms, before_id, day_ms, day_ms + DAY_MS))
+        for row in cursor:
+            if first_id is None or row[0] < first_id:
+                first_id = row[0]
+            times.append(row[1])
+            for index, column in enumerate(values):
+                column.append(row[index + 2])
+        cursor.close()
+
+        if first_id is not None:
+            path = os.path.join(archive_dir, f'{SQLITE_TABLE_NAME}-{get_day(day_ms)}.{first_id}{ARCHIVE_SUFFIX}')
+            write_archive(path, times, columns)
+            total += len(times)
+
+        day_ms += DAY_MS
+
+    return total
+
+def iter_archive_chunks(since_ms, until_ms, cols, chunk_rows, host = DEFAULT_HOST, archive_dir = ARCHIVE_DIR):
+    # rows (timestamp, time_ms, *cols) of host with since_ms <= time_ms < until_ms, in chunks
+    for path in get_archive_paths(since_ms, until_ms, host, archive_dir):
+        archive = ArchiveFile(path)
+        try:
+            if archive.header['last_ms'] < since_ms or archive.header['first_ms'] >= until_ms:
+                continue
+
+            # archive files are written in time_ms order
+            times = archive.read_times()
+            first = bisect_left(times, since_ms)
+            last = bisect_left(times, until_ms)
+            columns = [archive.read_column(col) for col in cols]
+        finally:
+            archive.close()
+
+        for start in range(first, last, chunk_rows):
+            stop = min(last, start + chunk_rows)
+            chunk_times = times[start:stop]
+            yield list(zip(format_timestamps(chunk_times), chunk_times, *[column[start:stop] for column in columns]))
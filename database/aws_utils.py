@@ -10,15 +10,22 @@ from constants import (
 import boto3
 import json
 import os
+import threading
 
-def print_rejected_records_exceptions(err):
-    print(f'RejectedRecords: {err}')
-    for rr in err.response['RejectedRecords']:
-        print(f"Rejected Index {rr['RecordIndex']}: {rr['Reason']}")
-    if 'ExistingVersion' in rr:
-        print(f"Rejected record existing version: {rr['ExistingVersion']}")
+# boto3 clients are thread safe and keep their connection pool, so one is shared for the process lifetime
+WRITE_CLIENT = None
+WRITE_CLIENT_LOCK = threading.Lock()
 
 def get_aws_write_client():
+    global WRITE_CLIENT
+
+    with WRITE_CLIENT_LOCK:
+        if WRITE_CLIENT is None:
+            WRITE_CLIENT = create_aws_write_client()
+
+    return WRITE_CLIENT
+
+def create_aws_write_client():
     profile_name=os.environ['AWS_PROFILE']
     
     session = boto3.Session(profile_name=profile_name)
@@ -30,7 +37,8 @@ def get_aws_write_client():
                 read_timeout = CONFIG_READ_TIMEOUT,
                 max_pool_connections = CONFIG_MAX_POOL_CONNECTION,
                 retries={
-                    'max_attempts': CONFIG_MAX_ATTEMPTS
+                    'max_attempts': CONFIG_MAX_ATTEMPTS,
+                    'mode': 'adaptive'
                 }
             )
         )
@@ -38,16 +46,21 @@ def get_aws_write_client():
     return write_client
 
 def prepare_common_attributes():
+    # the hostname dimension is set per record, see prepare_dimensions
     common_attributes = {
-        'Dimensions': [
-            {'Name': 'hostname', 'Value': 'Torrent7'}
-        ],
         'MeasureName': 'metric',
         'MeasureValueType': 'MULTI'
     }
     
     return common_attributes
 
+def prepare_dimensions(host):
+    dimensions = [
+        {'Name': 'hostname', 'Value': host}
+    ]
+    
+    return dimensions
+
 def prepare_measure(measure_name, measure_value):
     measure = {
         'Name': measure_name,
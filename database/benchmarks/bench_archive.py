@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Size and scan time of one archived day of 1 Hz rows: uniform random values (worst case) and
+# random walks rounded like HWiNFO readings (closer to real sensors), compared with SQLite.
+# usage: python benchmarks/bench_archive.py [days]
+
+from bench_utils import (
+    get_temp_db_file,
+    make_sensors_rows,
+    make_walk_rows,
+    remove_db_file
+)
+from archive_utils import (
+    archive_rows,
+    iter_archive_chunks
+)
+from constants import SORTED_SENSORS_LIST
+from datetime import datetime, timedelta
+from db_utils import (
+    get_insert_sql,
+    get_since_ms,
+    init_sql_table
+)
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+def run(name, make_rows, days):
+    count = int(days * 24 * 60 * 60)
+    db_file = get_temp_db_file()
+    archive_dir = tempfile.mkdtemp()
+
+    db_conn = init_sql_table(db_file)
+    with db_conn:
+        db_conn.executemany(get_insert_sql(), make_rows(count, datetime.utcnow() - timedelta(days=3)))
+    db_conn.execute('VACUUM')
+    sqlite_bytes = os.path.getsize(db_file)
+
+    started = time.perf_counter()
+    total = archive_rows(db_conn, get_since_ms(2 * 24 * 60), 2 ** 62, archive_dir)
+    archive_seconds = time.perf_counter() - started
+    archive_bytes = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(archive_dir) for f in files)
+
+    print(f'{name}: {total} rows archived in {archive_seconds:.2f}s, '
+          f'{archive_bytes / days / 1024 / 1024:.2f} MiB/day ({archive_bytes / total:.1f} bytes/row), '
+          f'sqlite incl. indexes and rollups {sqlite_bytes / days / 1024 / 1024:.2f} MiB/day, '
+          f'1 year: {archive_bytes / days * 365 / 1024 / 1024 / 1024:.2f} GiB')
+
+    since_ms = get_since_ms(10 * 24 * 60)
+    for cols in [SORTED_SENSORS_LIST, SORTED_SENSORS_LIST[:1]]:
+        started = time.perf_counter()
+        scanned = sum(len(chunk) for chunk in iter_archive_chunks(since_ms, get_since_ms(0), cols, 1000, archive_dir=archive_dir))
+        elapsed = time.perf_counter() - started
+        print(f'  scan {len(cols)} columns: {scanned} rows in {elapsed:.2f}s ({elapsed / days:.2f}s/day)')
+
+    db_conn.close()
+    remove_db_file(db_file)
+    shutil.rmtree(archive_dir)
+
+def main():
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+
+    run('uniform', make_sensors_rows, days)
+    run('random walk', make_walk_rows, days)
+
+main()
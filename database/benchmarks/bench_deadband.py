@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+# Storage and export volume of a day of 1 Hz rows from a mostly idle machine with and without the
+# deadband, how closely the filled /metrics stream and the rollup averages follow the original rows,
+# and what the fill costs on a database without any dropped rows.
+# Idle rows jitter within 80% of each sensor's tolerance; in the 'bursts' run a 60s burst every
+# 10 minutes moves them freely.
+# usage: python benchmarks/bench_deadband.py [hours]
+
+from bench_utils import (
+    get_temp_db_file,
+    make_sensors_rows,
+    remove_db_file
+)
+from constants import (
+    DATABASE_NAME,
+    DEFAULT_HOST,
+    MAX_RECORDS_PER_WRITE,
+    SORTED_SENSORS_LIST,
+    SQLITE_SAMPLES_COLUMNS,
+    SQLITE_TABLE_NAME,
+    TABLE_NAME
+)
+from db_utils import (
+    ReadPool,
+    get_insert_sql,
+    get_pragma,
+    init_sql_table
+)
+from deadband_utils import (
+    Deadband,
+    get_tolerances
+)
+from export_utils import (
+    iter_batches,
+    iter_rows
+)
+from response_utils import (
+    get_columns,
+    stream_query
+)
+from rollup_utils import (
+    query_aggregated,
+    update_rollups
+)
+import contextlib
+import io
+import json
+import random
+import sys
+import time
+
+BURST_EVERY = 600
+
+def make_idle_rows(count, burst_seconds):
+    rows = make_sensors_rows(count)
+    tolerances = get_tolerances()
+    bases = [random.uniform(20, 80) for _ in SORTED_SENSORS_LIST]
+    values = list(bases)
+
+    for index, row in enumerate(rows):
+        burst = index % BURST_EVERY < burst_seconds
+        for col, tolerance in enumerate(tolerances):
+            if burst:
+                values[col] += random.uniform(-5, 5) * tolerance
+            else:
+                values[col] = bases[col] + random.uniform(-0.4, 0.4) * tolerance
+            row[col + 2] = round(values[col], 2)
+
+    return rows
+
+def populate(rows, deadband):
+    db_file = get_temp_db_file()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_conn = init_sql_table(db_file)
+
+    if deadband is None:
+        sql = get_insert_sql()
+        stored = rows
+    else:
+        sql = deadband.sql
+        stored = list(filter(None, map(deadband.put, rows)))
+        stored.append(deadband.flush())
+
+    with db_conn:
+        db_conn.executemany(sql, stored)
+        update_rollups(db_conn, 0)
+    db_conn.execute('VACUUM')
+
+    return db_file, db_conn
+
+def get_export_bytes(db_conn):
+    total = 0
+    for _, _, _, records, common_attributes in iter_batches(iter_rows(db_conn, 0), MAX_RECORDS_PER_WRITE):
+        total += len(json.dumps({
+            'DatabaseName': DATABASE_NAME,
+            'TableName': TABLE_NAME,
+            'Records': records,
+            'CommonAttributes': common_attributes
+        }, separators=(',', ':')))
+
+    return total
+
+def read_stream(db_file, fill):
+    columns = get_columns(SORTED_SENSORS_LIST)
+    select = columns + SQLITE_SAMPLES_COLUMNS if fill else columns
+    sql = f"SELECT {', '.join(select)} FROM {SQLITE_TABLE_NAME} WHERE host = ? AND time_ms >= ? ORDER BY time_ms"
+
+    read_pool = ReadPool(1, db_file=db_file)
+    started = time.perf_counter()
+    body = b''.join(stream_query(read_pool, sql, (DEFAULT_HOST, 0), columns, 'rows', fill=fill))
+    elapsed = time.perf_counter() - started
+
+    return json.loads(body)['rows'], elapsed
+
+def report(name, db_file, db_conn):
+    rows = db_conn.execute(f'SELECT count(*) FROM {SQLITE_TABLE_NAME}').fetchone()[0]
+    size = get_pragma(db_conn, 'page_count') * get_pragma(db_conn, 'page_size')
+    export_bytes = get_export_bytes(db_conn)
+    print(f'{name}: {rows} rows stored, database {size / 2 ** 20:.1f} MiB, Timestream requests {export_bytes / 2 ** 20:.2f} MiB')
+
+def run(name, rows):
+    print(f'{name}:')
+
+    plain_file, plain_conn = populate(rows, None)
+    deadband_file, deadband_conn = populate(rows, Deadband())
+    report('  every row', plain_file, plain_conn)
+    report('  deadband', deadband_file, deadband_conn)
+
+    # the filled stream has a row for every original one, within tolerance of it
+    filled, _ = read_stream(deadband_file, True)
+    tolerances = get_tolerances()
+    by_time = {row[1]: row for row in filled}
+    matched = sum(1 for row in rows if row[1] in by_time)
+    over = sum(
+        1 for row in rows if row[1] in by_time
+        for value, filled_value, tolerance in zip(row[2:], by_time[row[1]][2:], tolerances)
+        if abs(value - filled_value) > tolerance + 1e-9
+    )
+    print(f'  filled stream: {len(filled)} rows for {len(rows)}, {matched} at the original times, values off by more than the tolerance: {over}')
+
+    # 1 minute averages from the rollups, relative to each sensor's tolerance
+    since_ms = rows[0][1]
+    plain = query_aggregated(plain_conn, since_ms, 60000, 'avg')
+    deadband = {row['time_ms']: row for row in query_aggregated(deadband_conn, since_ms, 60000, 'avg')}
+    worst = max(
+        abs(row[col] - deadband[row['time_ms']][col]) / tolerance
+        for row in plain if row['time_ms'] in deadband
+        for col, tolerance in zip(SORTED_SENSORS_LIST, tolerances)
+    )
+    print(f'  1m avg rollups: {len(plain)} vs {len(deadband)} buckets, worst difference {worst:.2f} x tolerance')
+
+    _, plain_elapsed = read_stream(plain_file, False)
+    _, fill_elapsed = read_stream(plain_file, True)
+    print(f'  /metrics stream of every row: {plain_elapsed:.2f}s, with fill {fill_elapsed:.2f}s')
+
+    for db_file, db_conn in [(plain_file, plain_conn), (deadband_file, deadband_conn)]:
+        db_conn.close()
+        remove_db_file(db_file)
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+    count = int(hours * 60 * 60)
+
+    run('idle', make_idle_rows(count, 0))
+    run('idle with bursts', make_idle_rows(count, 60))
+
+main()
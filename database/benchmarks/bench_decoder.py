@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+# Decode-to-row throughput on HWiNFO-style payloads: the old per-message
+# dict/SQL rebuilding in on_message vs PayloadDecoder (stdlib json and orjson).
+# usage: python benchmarks/bench_decoder.py [messages]
+
+from bench_utils import make_payload
+from constants import (
+    SENSOR_NAMES_SET,
+    SORTED_SENSORS_LIST,
+    SQLITE_TABLE_NAME
+)
+from datetime import datetime, timedelta
+from db_utils import get_epoch_ms
+import decoder_utils
+import json
+import sys
+import time
+
+def old_decode(payload):
+    message = payload.decode('utf-8')
+
+    payloadJson = json.loads(message)
+    timestamp = payloadJson['sent']
+    sensors = payloadJson['payload']
+
+    sensorsDict = dict.fromkeys(SENSOR_NAMES_SET, -1)
+
+    for each in sensors:
+        key = each['Id']
+        value = each['Value']
+
+        if key in sensorsDict:
+            sensorsDict[key] = value
+
+    cols = ', '.join(SORTED_SENSORS_LIST)
+    vals = map(lambda col: ':' + col, SORTED_SENSORS_LIST)
+    vals = ', '.join(vals)
+
+    sql = f"""INSERT INTO {SQLITE_TABLE_NAME}
+        (
+            timestamp,
+            time_ms,
+            {cols}
+        ) VALUES
+        (
+            :timestamp,
+            :time_ms,
+            {vals}
+        )
+    """
+
+    sensorsDict['timestamp'] = timestamp
+    sensorsDict['time_ms'] = get_epoch_ms(timestamp)
+
+    return sql, sensorsDict
+
+def run(name, decode, payloads):
+    started = time.perf_counter()
+    for payload in payloads:
+        decode(payload)
+    elapsed = time.perf_counter() - started
+
+    print(f'{name}: {len(payloads) / elapsed:,.0f} msg/s, {elapsed / len(payloads) * 1e6:.1f} us/msg')
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    start = datetime.utcnow()
+    payloads = [make_payload(start + timedelta(seconds=i)) for i in range(count)]
+    print(f'payload size: {len(payloads[0])} bytes, sensors: {len(json.loads(payloads[0])["payload"])}')
+
+    run('old on_message', old_decode, payloads)
+
+    orjson = decoder_utils.orjson
+    decoder_utils.orjson = None
+    run('PayloadDecoder json', decoder_utils.PayloadDecoder().decode, payloads)
+
+    if orjson is not None:
+        decoder_utils.orjson = orjson
+        run('PayloadDecoder orjson', decoder_utils.PayloadDecoder().decode, payloads)
+
+main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Bytes and records per WriteRecords request for a day of 1 Hz rows: every value of every row in
+# batches of 100 (prepare_record, the previous encoding) against RecordEncoder batches (no -1
+# placeholders, unchanged values only on keyframes, the host dimension in CommonAttributes).
+# Rows are random walks with two sensors the machine does not have; 'busy' changes 30% of the
+# values every second, 'idle' 5%.
+# usage: python benchmarks/bench_encoding.py [hours]
+
+from bench_utils import (
+    make_walk_rows,
+    prepare_record
+)
+from aws_utils import prepare_common_attributes
+from constants import (
+    DATABASE_NAME,
+    DEFAULT_HOST,
+    EXPORT_MAX_BYTES_PER_WRITE,
+    EXPORT_RECORDS_PER_WRITE,
+    MAX_RECORDS_PER_WRITE,
+    TABLE_NAME
+)
+from export_utils import iter_batches
+from sink_utils import format_line
+import json
+import sys
+import time
+
+MISSING = ['fan_gpu__fan3', 'temp_hdd__hdd2']
+
+def get_request_bytes(records, common_attributes):
+    return len(json.dumps({
+        'DatabaseName': DATABASE_NAME,
+        'TableName': TABLE_NAME,
+        'Records': records,
+        'CommonAttributes': common_attributes
+    }, separators=(',', ':')))
+
+def old_batches(rows, size = MAX_RECORDS_PER_WRITE):
+    for start in range(0, len(rows), size):
+        yield [prepare_record(row) for row in rows[start:start + size]], prepare_common_attributes()
+
+def new_batches(rows, size = MAX_RECORDS_PER_WRITE, max_bytes = None):
+    for _, _, _, records, common_attributes in iter_batches(rows, size, max_bytes):
+        yield records, common_attributes
+
+def report(name, rows, batches):
+    requests = 0
+    records = 0
+    measures = 0
+    total_bytes = 0
+
+    started = time.perf_counter()
+    for batch, common_attributes in batches:
+        requests += 1
+        records += len(batch)
+        measures += sum(len(record['MeasureValues']) for record in batch)
+        total_bytes += get_request_bytes(batch, common_attributes)
+    elapsed = time.perf_counter() - started
+
+    print(f'{name}: {requests} requests, {records / requests:.0f} records and {total_bytes / requests / 1024:.1f} KiB per request, '
+          f'{total_bytes / len(rows):.0f} bytes and {measures / len(rows):.1f} measures per row, '
+          f'{total_bytes / 2 ** 20:.1f} MiB ({elapsed:.2f}s)')
+
+def report_lines(name, rows, batches):
+    requests = 0
+    total_bytes = 0
+
+    for batch, common_attributes in batches:
+        requests += 1
+        total_bytes += len('\n'.join(filter(None, (format_line(record, common_attributes) for record in batch))))
+
+    print(f'{name}: {requests} requests, {total_bytes / requests / 1024:.0f} KiB per request, {total_bytes / len(rows):.0f} bytes per row')
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+    count = int(hours * 60 * 60)
+
+    for name, change_rate in [('busy', 0.3), ('idle', 0.05)]:
+        rows = [(index + 1, row[1], DEFAULT_HOST, *row[2:]) for index, row in enumerate(make_walk_rows(count, change_rate=change_rate, missing=MISSING))]
+
+        report(f'{name} timestream before', rows, old_batches(rows))
+        report(f'{name} timestream after', rows, new_batches(rows))
+        report_lines(f'{name} line before', rows, old_batches(rows, EXPORT_RECORDS_PER_WRITE))
+        report_lines(f'{name} line after', rows, new_batches(rows, EXPORT_RECORDS_PER_WRITE, EXPORT_MAX_BYTES_PER_WRITE))
+
+main()
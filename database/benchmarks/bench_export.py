@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+# Backlog catch-up time of export_rows against StubWriteClient, a local stub of the
+# timestream-write WriteRecords call (fixed latency, throttles above a concurrency limit).
+# usage: python benchmarks/bench_export.py [backlog hours]
+
+from bench_utils import (
+    StubWriteClient,
+    get_temp_db_file,
+    make_sensors_rows,
+    remove_db_file
+)
+from db_utils import (
+    get_insert_sql,
+    init_sql_table
+)
+from export_utils import (
+    export_rows,
+    set_export_cursor
+)
+from sink_utils import TimestreamSink
+import contextlib
+import io
+import sys
+import time
+
+CONCURRENCY = [1, 2, 4, 8]
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 6
+    count = int(hours * 60 * 60)
+
+    for concurrency in CONCURRENCY:
+        db_file = get_temp_db_file()
+        db_conn = init_sql_table(db_file)
+        with db_conn:
+            db_conn.executemany(get_insert_sql(), make_sensors_rows(count))
+        client = StubWriteClient()
+        sink = TimestreamSink(client)
+        # pretend nothing has been exported yet
+        set_export_cursor(db_conn, 0, 0, sink.name)
+
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            total = export_rows(db_conn, sink, concurrency)
+        elapsed = time.perf_counter() - started
+
+        print(f'concurrency {concurrency}: {total} rows in {elapsed:.2f}s ({total / elapsed:,.0f} rows/s), '
+              f'calls: {client.calls}, throttled: {client.throttled}, stored: {client.records}')
+
+        db_conn.close()
+        remove_db_file(db_file)
+
+main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# Server work per client for each new 1 Hz sample: polling /metrics?minutes=1 (ring buffer query +
+# encode a minute of rows) vs /live (fan-out + one delta event), and a client that never reads.
+# usage: python benchmarks/bench_live.py [clients]
+
+from bench_utils import make_sensors_rows
+from constants import (
+    LIVE_BUFFER_SIZE,
+    SORTED_SENSORS_LIST
+)
+from datetime import datetime
+from live_utils import (
+    Broadcaster,
+    iter_events
+)
+from response_utils import (
+    encode_dicts,
+    get_columns
+)
+from ring_utils import RingBuffer
+import random
+import sys
+import time
+
+SAMPLES = 300
+
+def make_rows(count):
+    # sensors drift slowly: most values repeat from one second to the next
+    rows = make_sensors_rows(count, datetime.utcnow())
+    for previous, row in zip(rows, rows[1:]):
+        for index in range(2, len(row)):
+            row[index] = previous[index] if random.random() < 0.7 else row[index]
+
+    return rows
+
+def bench_poll(rows, clients):
+    ring_buffer = RingBuffer()
+    for row in rows[:3600]:
+        ring_buffer.append(row)
+    columns = get_columns(SORTED_SENSORS_LIST)
+
+    sent = 0
+    started = time.perf_counter()
+    for row in rows[3600:3600 + SAMPLES]:
+        ring_buffer.append(row)
+        for _ in range(clients):
+            sent += len(encode_dicts(ring_buffer.query(row[1] - 60 * 1000, SORTED_SENSORS_LIST), columns, 'json'))
+    elapsed = time.perf_counter() - started
+
+    return elapsed, sent
+
+def bench_live(rows, clients):
+    broadcaster = Broadcaster(clients + 1)
+    streams = []
+    for _ in range(clients):
+        subscriber = broadcaster.subscribe('Torrent7', SORTED_SENSORS_LIST)
+        stream = iter_events(broadcaster, subscriber, 0)
+        next(stream)
+        streams.append(stream)
+
+    sent = 0
+    started = time.perf_counter()
+    for row in rows[3600:3600 + SAMPLES]:
+        broadcaster.publish('Torrent7', row)
+        for stream in streams:
+            sent += len(next(stream))
+    elapsed = time.perf_counter() - started
+
+    for stream in streams:
+        stream.close()
+
+    return elapsed, sent
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    rows = make_rows(3600 + SAMPLES)
+
+    for name, bench in [('poll /metrics?minutes=1', bench_poll), ('/live', bench_live)]:
+        elapsed, sent = bench(rows, clients)
+        print(f'{name}: {elapsed / SAMPLES / clients * 1e6:,.0f} us and {sent / SAMPLES / clients:,.0f} bytes '
+              f'per client per sample ({clients} clients)')
+
+    # a client that stopped reading keeps at most LIVE_BUFFER_SIZE rows
+    broadcaster = Broadcaster()
+    subscriber = broadcaster.subscribe('Torrent7', SORTED_SENSORS_LIST)
+    for row in rows:
+        broadcaster.publish('Torrent7', row)
+    print(f'stalled client: buffered {len(subscriber.rows)} (limit {LIVE_BUFFER_SIZE}), dropped {subscriber.dropped}')
+
+main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Peak RSS and records/s of export_rows backfills (1h, 24h, 7d) against StubWriteClient with no latency.
+# Every backfill runs in a child process so ru_maxrss only covers that run; --old runs the previous
+# fetchall + build every record + slice into batches approach for comparison (skipped for 7d).
+# usage: python benchmarks/bench_pipeline.py [--old]
+
+from bench_utils import (
+    StubWriteClient,
+    get_temp_db_file,
+    make_sensors_rows,
+    prepare_record,
+    remove_db_file
+)
+from constants import (
+    MAX_RECORDS_PER_WRITE,
+    SORTED_SENSORS_LIST,
+    SQLITE_TABLE_NAME
+)
+from db_utils import (
+    get_db_conn,
+    get_insert_sql,
+    init_sql_table
+)
+from export_utils import (
+    export_rows,
+    set_export_cursor
+)
+from sink_utils import TimestreamSink
+import contextlib
+import io
+import resource
+import subprocess
+import sys
+import time
+
+BACKFILLS = [('1h', 60 * 60), ('24h', 24 * 60 * 60), ('7d', 7 * 24 * 60 * 60)]
+OLD_MAX_ROWS = 24 * 60 * 60
+
+def old_export(db_conn, write_client, after_id):
+    cols = ', '.join(SORTED_SENSORS_LIST)
+    cursor = db_conn.cursor()
+    cursor.execute(f'SELECT id, time_ms, host, {cols} FROM {SQLITE_TABLE_NAME} WHERE id > ? ORDER BY id', (after_id,))
+    rows = cursor.fetchall()
+    cursor.close()
+
+    records = [prepare_record(row) for row in rows]
+    batches = [records[i * MAX_RECORDS_PER_WRITE:(i + 1) * MAX_RECORDS_PER_WRITE] for i in range((len(records) + MAX_RECORDS_PER_WRITE - 1) // MAX_RECORDS_PER_WRITE )]
+    for batch in batches:
+        write_client.write_records(DatabaseName=None, TableName=None, Records=batch, CommonAttributes=None)
+
+    return len(records)
+
+def child(db_file, count, mode):
+    db_conn = get_db_conn(db_file=db_file)
+    max_id = db_conn.execute(f'SELECT max(id) FROM {SQLITE_TABLE_NAME}').fetchone()[0]
+    client = StubWriteClient(latency=0, max_in_flight=1000, reject_every=10 ** 9)
+    sink = TimestreamSink(client)
+    set_export_cursor(db_conn, max_id - count, 0, sink.name)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == 'old':
+            total = old_export(db_conn, client, max_id - count)
+        else:
+            total = export_rows(db_conn, sink)
+    elapsed = time.perf_counter() - started
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'{mode}: {total} records in {elapsed:.1f}s ({total / elapsed:,.0f} records/s), '
+          f'peak rss {peak / 1024:.0f} MiB (+{(peak - baseline) / 1024:.0f} MiB)')
+
+def populate(db_file):
+    db_conn = init_sql_table(db_file)
+    count = max(seconds for _, seconds in BACKFILLS)
+    for start in range(0, count, 24 * 60 * 60):
+        with db_conn:
+            db_conn.executemany(get_insert_sql(), make_sensors_rows(min(24 * 60 * 60, count - start)))
+    db_conn.close()
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+        return
+    if sys.argv[1:2] == ['--populate']:
+        populate(sys.argv[2])
+        return
+
+    run_old = '--old' in sys.argv
+
+    # children inherit the parent's ru_maxrss, so the parent stays small
+    db_file = get_temp_db_file()
+    subprocess.run([sys.executable, __file__, '--populate', db_file], check=True, stdout=subprocess.DEVNULL)
+
+    for name, seconds in BACKFILLS:
+        modes = ['pipeline']
+        if run_old and seconds <= OLD_MAX_ROWS:
+            modes.append('old')
+
+        for mode in modes:
+            print(f'{name} ', end='', flush=True)
+            subprocess.run([sys.executable, __file__, '--child', db_file, str(seconds), mode], check=True)
+
+    remove_db_file(db_file)
+
+main()
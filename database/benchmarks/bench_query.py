@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# Query latency over 2 days of 1 Hz data: TEXT timestamp scans vs time_ms index range scans.
+# usage: python benchmarks/bench_query.py [rows]
+
+from bench_utils import (
+    get_temp_db_file,
+    make_sensors_rows,
+    remove_db_file
+)
+from constants import SQLITE_TABLE_NAME
+from db_utils import (
+    get_insert_sql,
+    get_since_ms,
+    init_sql_table
+)
+import sys
+import time
+
+REPEAT = 20
+
+QUERIES = [
+    (
+        '/metrics 1 minute',
+        f"SELECT * FROM {SQLITE_TABLE_NAME} WHERE timestamp >= datetime('now', '-1 minute')",
+        f'SELECT * FROM {SQLITE_TABLE_NAME} WHERE time_ms >= ?',
+        1
+    ),
+    (
+        'publish_remote 1 hour',
+        f"SELECT * FROM {SQLITE_TABLE_NAME} WHERE timestamp >= datetime('now', '-1 hour')",
+        f'SELECT * FROM {SQLITE_TABLE_NAME} WHERE time_ms >= ?',
+        60
+    ),
+    (
+        'clear_local 1 day',
+        f"SELECT count(*) FROM {SQLITE_TABLE_NAME} WHERE timestamp <= datetime('now', '-1 day')",
+        f'SELECT count(*) FROM {SQLITE_TABLE_NAME} WHERE time_ms <= ?',
+        24 * 60
+    )
+]
+
+def time_query(db_conn, sql, params = ()):
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        cursor = db_conn.cursor()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        cursor.close()
+
+    return (time.perf_counter() - started) / REPEAT * 1000
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2 * 24 * 60 * 60
+
+    db_file = get_temp_db_file()
+    db_conn = init_sql_table(db_file)
+    with db_conn:
+        db_conn.executemany(get_insert_sql(), make_sensors_rows(count))
+    print(f'rows: {count}')
+
+    for name, old_sql, new_sql, minutes in QUERIES:
+        old_ms = time_query(db_conn, old_sql)
+        new_ms = time_query(db_conn, new_sql, (get_since_ms(minutes),))
+        print(f'{name}: timestamp {old_ms:.2f} ms, time_ms {new_ms:.2f} ms')
+
+    db_conn.close()
+    remove_db_file(db_file)
+
+main()
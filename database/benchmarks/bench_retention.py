@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# Insert latency seen by a concurrent writer (one insert + commit every 10 ms on its own connection)
+# while retention removes a day of 1 Hz rows: one big DELETE (old clear_local) vs chunked deletes
+# followed by incremental vacuum.
+# usage: python benchmarks/bench_retention.py [days to delete]
+
+from bench_utils import (
+    get_temp_db_file,
+    make_sensors_rows,
+    remove_db_file
+)
+from constants import (
+    RETENTION_DAYS,
+    SQLITE_TABLE_NAME
+)
+from datetime import datetime
+from db_utils import (
+    get_db_conn,
+    get_insert_sql,
+    get_pragma,
+    get_since_ms,
+    init_sql_table
+)
+from retention_utils import (
+    clear_tables,
+    get_retention_cutoff_ms,
+    vacuum_incremental
+)
+import os
+import sys
+import threading
+import time
+
+def old_clear(db_conn, now_ms):
+    cursor = db_conn.cursor()
+    cursor.execute(f'DELETE FROM {SQLITE_TABLE_NAME} WHERE time_ms <= ?', (get_retention_cutoff_ms(RETENTION_DAYS, now_ms),))
+    total = cursor.rowcount
+    cursor.close()
+    db_conn.commit()
+
+    return total
+
+def new_clear(db_conn, now_ms):
+    total = sum(count for _, count in clear_tables(db_conn, 2 ** 62, now_ms))
+    vacuum_incremental(db_conn)
+
+    return total
+
+def insert_loop(db_file, stop, latencies):
+    db_conn = get_db_conn(db_file=db_file)
+    sql = get_insert_sql()
+    row = make_sensors_rows(1)[0]
+
+    while not stop.is_set():
+        started = time.perf_counter()
+        db_conn.execute(sql, row)
+        db_conn.commit()
+        latencies.append((started, time.perf_counter() - started))
+        time.sleep(0.01)
+
+    db_conn.close()
+
+def get_percentile(values, percent):
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+def run(name, clear, days):
+    db_file = get_temp_db_file()
+    db_conn = init_sql_table(db_file)
+    count = int((RETENTION_DAYS + days) * 24 * 60 * 60)
+    with db_conn:
+        db_conn.executemany(get_insert_sql(), make_sensors_rows(count, datetime.utcnow()))
+    size_before = os.path.getsize(db_file)
+
+    stop = threading.Event()
+    latencies = []
+    inserter = threading.Thread(target=insert_loop, args=(db_file, stop, latencies))
+    inserter.start()
+    time.sleep(1)
+
+    started = time.perf_counter()
+    total = clear(db_conn, get_since_ms(0))
+    finished = time.perf_counter()
+    elapsed = finished - started
+
+    stop.set()
+    inserter.join()
+    db_conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    # inserts started while the cleanup ran, one blocked by the big delete finishes after it
+    latencies = [latency for insert_started, latency in latencies if started <= insert_started < finished]
+    print(f'{name}: {total} rows in {elapsed:.2f}s, inserts during cleanup: {len(latencies)}, latency ms '
+          f'p50 {get_percentile(latencies, 50) * 1000:.1f}, p99 {get_percentile(latencies, 99) * 1000:.1f}, '
+          f'max {max(latencies) * 1000:.1f}; file {size_before / 1024 / 1024:.0f} -> '
+          f'{os.path.getsize(db_file) / 1024 / 1024:.0f} MiB, free pages {get_pragma(db_conn, "freelist_count")}')
+
+    db_conn.close()
+    remove_db_file(db_file)
+
+def main():
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+
+    run('single delete', old_clear, days)
+    run('chunked + incremental vacuum', new_clear, days)
+
+main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# /metrics step/agg latency over a week of 1 Hz data: raw rows vs aggregated buckets.
+# usage: python benchmarks/bench_rollup.py [days]
+
+from bench_utils import (
+    get_temp_db_file,
+    make_sensors_rows,
+    remove_db_file
+)
+from db_utils import (
+    get_db_conn,
+    get_insert_sql,
+    get_since_ms,
+    init_sql_table
+)
+from rollup_utils import (
+    query_aggregated,
+    update_rollups
+)
+import sys
+import time
+
+QUERIES = [
+    (0, None),
+    (300, 'avg'),
+    (3600, 'avg'),
+    (3600, 'max'),
+    (3600, 'last'),
+    (30, 'avg'),
+    (3600, 'p95')
+]
+
+def main():
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else 7
+    count = int(days * 24 * 60 * 60)
+
+    db_file = get_temp_db_file()
+    db_conn = init_sql_table(db_file)
+    with db_conn:
+        db_conn.executemany(get_insert_sql(), make_sensors_rows(count))
+        update_rollups(db_conn, 0)
+    db_conn.close()
+    print(f'rows: {count}')
+
+    db_conn = get_db_conn(True, db_file=db_file)
+    since_ms = get_since_ms(int(days * 24 * 60))
+
+    for step, agg in QUERIES:
+        started = time.perf_counter()
+        if step == 0:
+            rows = db_conn.execute('SELECT * FROM multi_sensors_data WHERE time_ms >= ?', (since_ms,)).fetchall()
+        else:
+            rows = query_aggregated(db_conn, since_ms, step * 1000, agg)
+        elapsed = (time.perf_counter() - started) * 1000
+
+        print(f'step={step}s agg={agg}: {len(rows)} points in {elapsed:.1f} ms')
+
+    db_conn.close()
+    remove_db_file(db_file)
+
+main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Ingest rate with 1..8 publishing machines: every message goes through TopicRouter, its device
+# PayloadDecoder and the shared BatchWriter, the way on_message handles it.
+# usage: python benchmarks/bench_router.py [messages per machine]
+
+from bench_utils import (
+    get_temp_db_file,
+    make_payload,
+    remove_db_file
+)
+from constants import SORTED_SENSORS_LIST
+from datetime import datetime, timedelta
+from db_utils import (
+    get_insert_sql,
+    init_sql_table
+)
+from router_utils import TopicRouter
+from writer_utils import BatchWriter
+import contextlib
+import io
+import sys
+import time
+
+PUBLISHERS = [1, 2, 4, 8]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    now = datetime.utcnow()
+    payloads = [make_payload(now - timedelta(seconds=i), 0) for i in range(count)]
+
+    for publishers in PUBLISHERS:
+        devices = {f'bedroom/pc{i}': (f'PC{i}', SORTED_SENSORS_LIST) for i in range(publishers)}
+        router = TopicRouter(devices)
+        # publishers interleave, like messages arriving from several machines at once
+        messages = [(topic, payload) for payload in payloads for topic in devices]
+
+        db_file = get_temp_db_file()
+        with contextlib.redirect_stdout(io.StringIO()):
+            init_sql_table(db_file).close()
+        writer = BatchWriter(get_insert_sql(), db_file=db_file)
+        writer.start()
+
+        started = time.perf_counter()
+        for topic, payload in messages:
+            decoder = router.get(topic)
+            writer.put(decoder.decode(payload), decoder.sql)
+        enqueued = time.perf_counter() - started
+        writer.stop()
+        elapsed = time.perf_counter() - started
+
+        print(f'{publishers} publishers: {len(messages) / elapsed:,.0f} msg/s ({elapsed:.2f}s), '
+              f'on_message side {enqueued / len(messages) * 1e6:.1f} us/msg, '
+              f'written: {writer.written}, dropped: {writer.dropped}')
+
+        remove_db_file(db_file)
+
+main()
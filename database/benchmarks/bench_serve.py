@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# /metrics requests/s with concurrent keep-alive clients: the old Werkzeug development server with
+# debug=True vs waitress. Server and clients run in their own processes so they do not share a GIL.
+# usage: python benchmarks/bench_serve.py [seconds per run]
+
+from bench_utils import (
+    get_temp_db_file,
+    make_sensors_rows,
+    remove_db_file
+)
+from constants import FLASK_THREADS
+from datetime import datetime
+from db_utils import (
+    get_insert_sql,
+    init_sql_table
+)
+import contextlib
+import http.client
+import io
+import socket
+import subprocess
+import sys
+import time
+
+PORT = 3999
+CLIENTS = [1, 4, 16]
+PATHS = ['/metrics?minutes=1', '/metrics?minutes=120&group=temp&format=rows']
+
+def server(mode, db_file):
+    import app
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.userdata = app.init_userdata(db_file)
+
+    if mode == 'werkzeug':
+        import logging
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        app.FLASK_APP.run(host='127.0.0.1', port=PORT, debug=True, use_reloader=False)
+    else:
+        import waitress
+        waitress.serve(app.FLASK_APP, host='127.0.0.1', port=PORT, threads=FLASK_THREADS, ident=None)
+
+def client(path, seconds):
+    count = 0
+    conn = None
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        if conn is None:
+            conn = http.client.HTTPConnection('127.0.0.1', PORT)
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        count += 1
+
+        # HTTP/1.0 servers close after every response
+        if response.will_close:
+            conn.close()
+            conn = None
+
+    print(count)
+
+def wait_for_port():
+    for _ in range(200):
+        try:
+            socket.create_connection(('127.0.0.1', PORT)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+def main():
+    if sys.argv[1:2] == ['--server']:
+        server(sys.argv[2], sys.argv[3])
+        return
+    if sys.argv[1:2] == ['--client']:
+        client(sys.argv[2], float(sys.argv[3]))
+        return
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    db_file = get_temp_db_file()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_conn = init_sql_table(db_file)
+        with db_conn:
+            db_conn.executemany(get_insert_sql(), make_sensors_rows(3 * 60 * 60, datetime.utcnow()))
+        db_conn.close()
+
+    for mode in ['werkzeug', 'waitress']:
+        process = subprocess.Popen([sys.executable, __file__, '--server', mode, db_file], stderr=subprocess.DEVNULL)
+        wait_for_port()
+
+        for path in PATHS:
+            for clients in CLIENTS:
+                children = [
+                    subprocess.Popen([sys.executable, __file__, '--client', path, str(seconds)], stdout=subprocess.PIPE)
+                    for _ in range(clients)
+                ]
+                total = sum(int(child.communicate()[0]) for child in children)
+                print(f'{mode} {path}, {clients} clients: {total / seconds:,.0f} req/s')
+
+        process.kill()
+        process.wait()
+        time.sleep(0.5)
+
+    remove_db_file(db_file)
+
+main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Export throughput of each sink for the same backlog: Timestream (StubWriteClient, 100 records per
+# call), the JSON lines file sink, and line protocol against FakeLineServer with and without gzip
+# and connection keep-alive.
+# usage: python benchmarks/bench_sinks.py [backlog hours] [server latency ms]
+
+from bench_utils import (
+    FakeLineServer,
+    StubWriteClient,
+    get_temp_db_file,
+    make_sensors_rows,
+    remove_db_file
+)
+from db_utils import (
+    get_insert_sql,
+    init_sql_table
+)
+from export_utils import (
+    export_rows,
+    set_export_cursor
+)
+from sink_utils import (
+    FileSink,
+    LineProtocolSink,
+    TimestreamSink
+)
+import contextlib
+import io
+import os
+import sys
+import time
+
+def run(db_conn, sink):
+    set_export_cursor(db_conn, 0, 0, sink.name)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        total = export_rows(db_conn, sink)
+    elapsed = time.perf_counter() - started
+
+    return total, elapsed
+
+def main():
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 6
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.01
+
+    db_file = get_temp_db_file()
+    db_conn = init_sql_table(db_file)
+    with db_conn:
+        db_conn.executemany(get_insert_sql(), make_sensors_rows(int(hours * 60 * 60)))
+
+    client = StubWriteClient(latency=latency, reject_every=10 ** 9)
+    total, elapsed = run(db_conn, TimestreamSink(client))
+    print(f'timestream stub: {total} rows in {elapsed:.2f}s ({total / elapsed:,.0f} rows/s), calls: {client.calls}')
+
+    export_file = db_file + '.jsonl'
+    total, elapsed = run(db_conn, FileSink(export_file))
+    print(f'file: {total} rows in {elapsed:.2f}s ({total / elapsed:,.0f} rows/s), {os.path.getsize(export_file) / 2 ** 20:.1f} MiB')
+    os.remove(export_file)
+
+    for gzip_level, keep_alive in [(0, False), (0, True), (6, True), (1, True)]:
+        server = FakeLineServer(latency)
+        sink = LineProtocolSink(server.url, gzip_level=gzip_level, keep_alive=keep_alive)
+        total, elapsed = run(db_conn, sink)
+        print(f'line gzip {gzip_level}, keep-alive {keep_alive}: {total} rows in {elapsed:.2f}s ({total / elapsed:,.0f} rows/s), '
+              f'requests: {server.requests}, connections: {server.connections}, '
+              f'{server.bytes / server.requests / 1024:.0f} KiB/request, lines: {server.lines}')
+        server.stop()
+
+    db_conn.close()
+    remove_db_file(db_file)
+
+main()
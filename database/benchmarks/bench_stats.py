@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+# Per-message cost of the instrumentation on the ingest path (MESSAGES.inc in on_message, two
+# perf_counter calls and MESSAGE_SECONDS.observe in handle_message) and of one /prometheus render.
+# usage: python benchmarks/bench_stats.py [messages]
+
+import bench_utils
+from stats_utils import (
+    MESSAGE_SECONDS,
+    MESSAGES,
+    render
+)
+import sys
+import threading
+import time
+
+def instrumented(count):
+    for _ in range(count):
+        MESSAGES.inc()
+        started = time.perf_counter()
+        MESSAGE_SECONDS.observe(time.perf_counter() - started)
+
+def bare(count):
+    for _ in range(count):
+        pass
+
+def measure(func, count, threads):
+    workers = [threading.Thread(target=func, args=(count // threads,)) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    return time.perf_counter() - started
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    for threads in [1, 2, 4]:
+        overhead = measure(instrumented, count, threads) - measure(bare, count, threads)
+        print(f'{threads} threads: {overhead / count * 1e6:.2f} us/msg')
+
+    started = time.perf_counter()
+    body = render()
+    print(f'render: {(time.perf_counter() - started) * 1000:.2f} ms, {len(body)} bytes')
+
+main()
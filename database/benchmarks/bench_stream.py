@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# Peak memory and time-to-first-byte of /metrics bodies for 1h/24h/48h windows:
+# fetchall + dicts + json.dumps (old) vs the chunked stream_query encoders.
+# Timings run under tracemalloc, compare them relative to each other.
+# usage: python benchmarks/bench_stream.py
+
+from bench_utils import (
+    get_temp_db_file,
+    make_sensors_rows,
+    remove_db_file
+)
+from constants import (
+    SORTED_SENSORS_LIST,
+    SQLITE_TABLE_NAME
+)
+from db_utils import (
+    ReadPool,
+    get_insert_sql,
+    get_since_ms,
+    init_sql_table
+)
+from response_utils import (
+    MIMETYPES,
+    get_columns,
+    orjson,
+    stream_query
+)
+import json
+import time
+import tracemalloc
+
+WINDOWS = [60, 24 * 60, 48 * 60]
+
+def old_body(read_pool, since_ms):
+    sql = f'SELECT * FROM {SQLITE_TABLE_NAME} WHERE time_ms >= ?'
+    with read_pool.connection() as db_conn:
+        cursor = db_conn.cursor()
+        cursor.execute(sql, (since_ms,))
+        rows = cursor.fetchall()
+        cursor.close()
+
+    yield json.dumps([dict(row) for row in rows])
+
+def measure(body):
+    tracemalloc.start()
+    started = time.perf_counter()
+
+    ttfb = None
+    size = 0
+    for chunk in body:
+        if ttfb is None:
+            ttfb = time.perf_counter() - started
+        size += len(chunk)
+
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return ttfb * 1000, elapsed * 1000, peak / 1024 / 1024, size / 1024 / 1024
+
+def main():
+    db_file = get_temp_db_file()
+    db_conn = init_sql_table(db_file)
+    with db_conn:
+        db_conn.executemany(get_insert_sql(), make_sensors_rows(max(WINDOWS) * 60))
+    db_conn.close()
+
+    read_pool = ReadPool(1, db_file=db_file)
+    columns = get_columns(SORTED_SENSORS_LIST)
+    sql = f"SELECT {', '.join(columns)} FROM {SQLITE_TABLE_NAME} WHERE time_ms >= ? ORDER BY time_ms"
+    print(f"orjson: {orjson is not None}, formats: {', '.join(MIMETYPES)}")
+
+    for minutes in WINDOWS:
+        since_ms = get_since_ms(minutes)
+        bodies = [('old', old_body(read_pool, since_ms))]
+        for fmt in MIMETYPES:
+            bodies.append((fmt, stream_query(read_pool, sql, (since_ms,), columns, fmt)))
+
+        for name, body in bodies:
+            ttfb, elapsed, peak, size = measure(body)
+            print(f'{minutes // 60}h {name}: ttfb {ttfb:.1f} ms, total {elapsed:.0f} ms, '
+                  f'peak {peak:.1f} MiB, body {size:.1f} MiB')
+
+    read_pool.close()
+    remove_db_file(db_file)
+
+main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+# benchmarks import the service modules the same way app.py does
+sys.path.insert(0, os.path.join(os.path.dirname( __file__ ), '..'))
+
+from aws_utils import prepare_measure
+from constants import SORTED_SENSORS_LIST
+from datetime import datetime, timedelta
+from db_utils import get_epoch_ms
+from export_utils import get_dimensions
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import json
+import random
+import tempfile
+import threading
+import time
+
+MEASURE_TEMPLATES = [prepare_measure(metric, 0) for metric in SORTED_SENSORS_LIST]
+
+def get_temp_db_file():
+    fd, db_file = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+
+    return db_file
+
+def remove_db_file(db_file):
+    for suffix in ['', '-wal', '-shm', '-journal']:
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+
+def make_timestamp(dt_obj):
+    return dt_obj.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+def make_sensors_row(dt_obj):
+    timestamp = make_timestamp(dt_obj)
+    values = [round(random.uniform(0, 100), 3) for _ in SORTED_SENSORS_LIST]
+
+    return [timestamp, get_epoch_ms(timestamp)] + values
+
+def make_sensors_rows(count, end = None, step_seconds = 1):
+    if end is None:
+        end = datetime.utcnow()
+    start = end - timedelta(seconds=count * step_seconds)
+
+    return [make_sensors_row(start + timedelta(seconds=i * step_seconds)) for i in range(count)]
+
+def make_walk_rows(count, end = None, change_rate = 0.3, missing = ()):
+    # random walks rounded like HWiNFO readings, each value changes on change_rate of the rows;
+    # missing sensors hold the -1 placeholder like a machine without them
+    rows = make_sensors_rows(count, end)
+    values = [random.uniform(20, 80) for _ in SORTED_SENSORS_LIST]
+    missing = [SORTED_SENSORS_LIST.index(col) for col in missing]
+
+    for row in rows:
+        for index in range(len(values)):
+            if random.random() < change_rate:
+                values[index] = min(100, max(0, values[index] + random.uniform(-1, 1)))
+            row[index + 2] = round(values[index], 1)
+        for index in missing:
+            row[index + 2] = -1
+
+    return rows
+
+def make_payload(dt_obj, extra_sensors = 150):
+    # HWiNFO-style message: the sensors we store plus the many we ignore
+    sensors = []
+    for index, col in enumerate(SORTED_SENSORS_LIST + [f'unused_{i}__measure' for i in range(extra_sensors)]):
+        sensors.append({
+            'Id': col,
+            'Label': col.replace('_', ' ').title(),
+            'Unit': 'C',
+            'Value': round(random.uniform(0, 100), 3),
+            'ValueMin': 0.0,
+            'ValueMax': 100.0,
+            'ValueAvg': 50.0
+        })
+    random.shuffle(sensors)
+
+    payloadJson = {
+        'sent': make_timestamp(dt_obj),
+        'delimitter': '__',
+        'payload': sensors
+    }
+
+    return json.dumps(payloadJson).encode('utf-8')
+
+def prepare_record(row):
+    # every value of the row, as records were built before RecordEncoder
+    sqlite_id, time, host, *rest = row
+
+    measures = []
+    for template, value in zip(MEASURE_TEMPLATES, rest):
+        measure = template.copy()
+        measure['Value'] = str(value)
+        measures.append(measure)
+
+    return {
+        'Dimensions': get_dimensions(host),
+        'Time': str(time),
+        'MeasureValues': measures
+    }
+
+class ThrottlingException(Exception):
+    pass
+
+class RejectedRecordsException(Exception):
+    def __init__(self, response):
+        super().__init__('rejected')
+        self.response = response
+
+class StubWriteClient:
+    # stands in for the boto3 timestream-write client: fixed latency, throttles above
+    # max_in_flight concurrent calls and rejects one record of every reject_every-th call
+    class exceptions:
+        RejectedRecordsException = RejectedRecordsException
+        ThrottlingException = ThrottlingException
+
+    def __init__(self, latency = 0.05, max_in_flight = 6, reject_every = 50):
+        self.latency = latency
+        self.max_in_flight = max_in_flight
+        self.reject_every = reject_every
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.records = 0
+        self.throttled = 0
+
+    def write_records(self, DatabaseName, TableName, Records, CommonAttributes):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+            if self.in_flight >= self.max_in_flight:
+                self.throttled += 1
+                raise ThrottlingException('Rate exceeded')
+            self.in_flight += 1
+
+        time.sleep(self.latency)
+
+        with self.lock:
+            self.in_flight -= 1
+            # every reject_every-th call has its first record rejected, the exporter drops it
+            if calls % self.reject_every == 0 and len(Records) > 1:
+                self.records += len(Records) - 1
+                raise RejectedRecordsException({'RejectedRecords': [{'RecordIndex': 0, 'Reason': 'stub'}]})
+            self.records += len(Records)
+
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+class FakeLineServer:
+    # stands in for an InfluxDB write endpoint: HTTP/1.1 keep-alive, accepts gzipped bodies,
+    # answers 204 after a fixed latency and counts connections, requests, bytes and lines
+    def __init__(self, latency = 0.01):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                size = len(body)
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                time.sleep(server.latency)
+
+                with server.lock:
+                    server.requests += 1
+                    server.bytes += size
+                    server.lines += body.count(b'\n') + 1
+
+                self.send_response(204)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.bytes = 0
+        self.lines = 0
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/api/v2/write?bucket=bench&precision=ms'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Time a burst of messages keeps the paho network thread busy: decoding inline in on_message (old)
+# vs handing the message to MessageWorkers, plus drain time, drops and per-topic order.
+# usage: python benchmarks/bench_workers.py [burst size]
+
+from bench_utils import (
+    get_temp_db_file,
+    make_payload,
+    remove_db_file
+)
+from constants import SORTED_SENSORS_LIST
+from datetime import datetime, timedelta
+from db_utils import (
+    get_insert_sql,
+    init_sql_table
+)
+from ring_utils import RingBuffer
+from router_utils import TopicRouter
+from worker_utils import MessageWorkers
+from writer_utils import BatchWriter
+import contextlib
+import io
+import sys
+import time
+
+TOPICS = 4
+
+def handle_message(userdata, topic, payload):
+    # app.handle_message without the print
+    decoder = userdata['router'].get(topic)
+    row = decoder.decode(payload)
+    userdata['ring_buffers'][decoder.host].append(row)
+    userdata['writer'].put(row, decoder.sql)
+    userdata['order'].setdefault(topic, []).append(row[1])
+
+def run(name, messages, workers):
+    devices = {f'bedroom/pc{i}': (f'PC{i}', SORTED_SENSORS_LIST) for i in range(TOPICS)}
+    db_file = get_temp_db_file()
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_sql_table(db_file).close()
+    writer = BatchWriter(get_insert_sql(), db_file=db_file)
+    writer.start()
+
+    userdata = {
+        'order': {},
+        'ring_buffers': {host: RingBuffer(host=host) for host, _ in devices.values()},
+        'router': TopicRouter(devices),
+        'writer': writer
+    }
+    pool = None
+    if workers > 0:
+        pool = MessageWorkers(handle_message, userdata, workers)
+        pool.start()
+
+    # the network thread: the longest single on_message call is how long a PINGRESP could wait
+    longest = 0
+    started = time.perf_counter()
+    for index, payload in enumerate(messages):
+        topic = f'bedroom/pc{index % TOPICS}'
+        call_started = time.perf_counter()
+        if pool is None:
+            handle_message(userdata, topic, payload)
+        else:
+            pool.put(topic, payload)
+        longest = max(longest, time.perf_counter() - call_started)
+    blocked = time.perf_counter() - started
+
+    dropped = 0
+    if pool is not None:
+        pool.stop()
+        dropped = pool.dropped
+    drained = time.perf_counter() - started
+    writer.stop()
+
+    # payloads are generated newest first, so every topic must see strictly decreasing times
+    ordered = all(times == sorted(times, reverse=True) for times in userdata['order'].values())
+    print(f'{name}: network thread busy {blocked * 1000:.0f} ms (longest call {longest * 1e6:.0f} us), '
+          f'drained in {drained * 1000:.0f} ms, dropped: {dropped}, written: {writer.written}, per-topic order kept: {ordered}')
+
+    remove_db_file(db_file)
+
+def main():
+    burst = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    now = datetime.utcnow()
+    messages = [make_payload(now - timedelta(milliseconds=i)) for i in range(burst)]
+
+    run('inline on_message', messages, 0)
+    for workers in [1, 2, 4]:
+        run(f'{workers} workers', messages, workers)
+
+main()
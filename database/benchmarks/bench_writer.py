@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Sustained ingest rate: per-row commit (old on_message) vs BatchWriter group commit, both keeping
+# the rollups up to date in the insert transaction like the writer does.
+# usage: python benchmarks/bench_writer.py [messages]
+
+from bench_utils import (
+    get_temp_db_file,
+    make_sensors_rows,
+    remove_db_file
+)
+from db_utils import (
+    get_insert_sql,
+    init_sql_table
+)
+from rollup_utils import (
+    get_max_id,
+    update_rollups
+)
+from writer_utils import BatchWriter
+import sys
+import time
+
+def bench_per_row_commit(rows):
+    db_file = get_temp_db_file()
+    db_conn = init_sql_table(db_file)
+    sql = get_insert_sql()
+
+    started = time.perf_counter()
+    for row in rows:
+        cursor = db_conn.cursor()
+        after_id = get_max_id(db_conn)
+        cursor.execute(sql, row)
+        update_rollups(db_conn, after_id)
+        db_conn.commit()
+        cursor.close()
+    elapsed = time.perf_counter() - started
+
+    db_conn.close()
+    remove_db_file(db_file)
+
+    return elapsed
+
+def bench_batch_writer(rows):
+    db_file = get_temp_db_file()
+    init_sql_table(db_file).close()
+
+    writer = BatchWriter(get_insert_sql(), db_file=db_file)
+    writer.start()
+
+    started = time.perf_counter()
+    for row in rows:
+        writer.put(row)
+    enqueued = time.perf_counter() - started
+    writer.stop()
+    elapsed = time.perf_counter() - started
+
+    remove_db_file(db_file)
+
+    return enqueued, elapsed, writer.dropped
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rows = make_sensors_rows(count)
+
+    elapsed = bench_per_row_commit(rows)
+    print(f'per-row commit: {count / elapsed:,.0f} msg/s ({elapsed:.3f}s)')
+
+    enqueued, elapsed, dropped = bench_batch_writer(rows)
+    print(f'batch writer:   {count / elapsed:,.0f} msg/s ({elapsed:.3f}s), '
+          f'on_message side {enqueued / count * 1e6:.2f} us/msg, dropped: {dropped}')
+
+main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# p50/p99 latency of /metrics under several concurrent pollers.
+# Run it against a live service (MQTT ingestion already running), or pass --ingest-db
+# to also insert rows into the service's database file at --ingest-rate rows/s.
+# usage: python benchmarks/load_metrics.py --url http://localhost:3000/metrics?minutes=5 --pollers 8
+
+from bench_utils import make_sensors_row
+from datetime import datetime
+from db_utils import get_insert_sql
+from writer_utils import BatchWriter
+import argparse
+import threading
+import time
+import urllib.request
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+
+    return values[index]
+
+def poll(url, deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url) as response:
+                response.read()
+            latencies.append((time.perf_counter() - started) * 1000)
+        except Exception as err:
+            errors.append(err)
+
+def ingest(db_file, rate, deadline):
+    writer = BatchWriter(get_insert_sql(), db_file=db_file)
+    writer.start()
+
+    while time.monotonic() < deadline:
+        writer.put(make_sensors_row(datetime.utcnow()))
+        time.sleep(1 / rate)
+
+    writer.stop()
+    print(f'ingested: {writer.written}, dropped: {writer.dropped}')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:3000/metrics?minutes=1')
+    parser.add_argument('--pollers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--ingest-db', default=None)
+    parser.add_argument('--ingest-rate', type=float, default=100)
+    args = parser.parse_args()
+
+    deadline = time.monotonic() + args.seconds
+    latencies = []
+    errors = []
+
+    threads = [threading.Thread(target=poll, args=(args.url, deadline, latencies, errors)) for _ in range(args.pollers)]
+    if args.ingest_db:
+        threads.append(threading.Thread(target=ingest, args=(args.ingest_db, args.ingest_rate, deadline)))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if len(latencies) == 0:
+        print(f'no successful requests, errors: {len(errors)}')
+        return
+
+    print(f'pollers: {args.pollers}, requests: {len(latencies)}, errors: {len(errors)}, '
+          f'{len(latencies) / args.seconds:,.1f} req/s')
+    print(f'p50: {percentile(latencies, 50):.2f} ms, p99: {percentile(latencies, 99):.2f} ms, '
+          f'max: {max(latencies):.2f} ms')
+
+main()
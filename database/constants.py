@@ -2,6 +2,8 @@ import os
 
 # PATH
 BASE_DIR = os.path.join(os.path.dirname( __file__ ), '..')
+# files shared with database-cron resolve here whatever the working directory, both containers mount it
+DATABASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # DATETIME
 DT_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
@@ -14,8 +16,73 @@ PC_PUBLISH_TOPIC = 'bedroom/torrent7'
 TOPIC = 'bedroom/#'
 
 # SQLITE
-DATABASE_FILE = 'multisensors.db'
+DATABASE_FILE = os.environ.get('DATABASE_FILE', os.path.join(DATABASE_DIR, 'multisensors.db'))
 SQLITE_TABLE_NAME = 'multi_sensors_data'
+SQLITE_ARCHIVE_PENDING_TABLE_NAME = 'archive_pending'
+SQLITE_BUSY_TIMEOUT = 5000 # ms
+SQLITE_CACHE_SIZE = -8192 # negative means KiB
+SQLITE_EXPORT_CURSOR_TABLE_NAME = 'export_cursor'
+SQLITE_EXPORT_OUTBOX_TABLE_NAME = 'export_outbox'
+SQLITE_MMAP_SIZE = 64 * 1024 * 1024
+SQLITE_SAMPLES_COLUMNS = ['samples', 'span_ms'] # a row stands for samples messages over span_ms, see deadband_utils.py
+SQLITE_SYNCHRONOUS = 'NORMAL' # safe in WAL mode, only the last commits can roll back on power loss
+
+# ARCHIVE
+# rows removed by clear_local are compacted into per-day columnar files here (see archive_utils.py)
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(DATABASE_DIR, 'archive'))
+
+# ROLLUPS
+# (table, bucket ms, retention days), kept up to date by the writer on every flush
+ROLLUPS = [
+    (f'{SQLITE_TABLE_NAME}_1m', 60 * 1000, float(os.environ.get('RETENTION_DAYS_1M', 30))),
+    (f'{SQLITE_TABLE_NAME}_1h', 60 * 60 * 1000, float(os.environ.get('RETENTION_DAYS_1H', 365)))
+]
+
+# RETENTION
+# clear_local deletes RETENTION_CHUNK_ROWS rows per transaction and sleeps RETENTION_PAUSE_SECONDS
+# in between so the writer never waits long for the write lock, freed pages are handed back
+# to the filesystem RETENTION_VACUUM_PAGES at a time the same way
+RETENTION_DAYS = float(os.environ.get('RETENTION_DAYS', 2)) # raw rows, rollups are in ROLLUPS
+RETENTION_CHUNK_ROWS = int(os.environ.get('RETENTION_CHUNK_ROWS', 2000))
+RETENTION_PAUSE_SECONDS = float(os.environ.get('RETENTION_PAUSE_SECONDS', 0.05))
+RETENTION_VACUUM_PAGES = int(os.environ.get('RETENTION_VACUUM_PAGES', 256))
+
+# RING BUFFER
+# newest rows kept in memory for /metrics, 3600 is one hour at 1 Hz (~1.2 MB)
+RING_BUFFER_SIZE = int(os.environ.get('RING_BUFFER_SIZE', 3600))
+
+# JOBS
+# publish_remote, clear_local and replay_outbox run on JOB_WORKERS threads, see job_utils.py; with
+# JOBS='cron' the ingest process leaves them to database-cron, a separate process on the same file
+# which serves its own /prometheus on CRON_PORT and waits for the ingest process to migrate the schema
+CRON_PORT = int(os.environ.get('CRON_PORT', 3001))
+CRON_SCHEMA_POLL_SECONDS = 5
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 3))
+JOBS = os.environ.get('JOBS', 'app')
+
+# LIVE
+# /live subscribers each get a buffer of LIVE_BUFFER_SIZE rows (oldest dropped when a client falls
+# behind), a comment line every LIVE_KEEPALIVE_SECONDS detects closed connections
+LIVE_BUFFER_SIZE = int(os.environ.get('LIVE_BUFFER_SIZE', 60))
+LIVE_KEEPALIVE_SECONDS = 15
+LIVE_MAX_SUBSCRIBERS = int(os.environ.get('LIVE_MAX_SUBSCRIBERS', 8)) # keep below FLASK_THREADS
+
+# WRITER
+# rows are buffered for at most WRITER_FLUSH_SECONDS (the durability window)
+# or until WRITER_BATCH_SIZE rows are queued, then committed in one transaction; a batch that still
+# finds the file locked after SQLITE_BUSY_TIMEOUT (database-cron writes to it too) is retried
+# WRITER_RETRIES times, WRITER_RETRY_SECONDS doubling in between, before its rows are dropped
+WRITER_BATCH_SIZE = int(os.environ.get('WRITER_BATCH_SIZE', 500))
+WRITER_FLUSH_SECONDS = float(os.environ.get('WRITER_FLUSH_SECONDS', 1))
+WRITER_QUEUE_SIZE = int(os.environ.get('WRITER_QUEUE_SIZE', 10000))
+WRITER_RETRIES = 4
+WRITER_RETRY_SECONDS = 0.5
+
+# WORKERS
+# messages are decoded off the paho network thread by MESSAGE_WORKERS threads, each topic always
+# goes to the same worker so its messages stay in order; a full worker queue drops the message
+MESSAGE_QUEUE_SIZE = int(os.environ.get('MESSAGE_QUEUE_SIZE', 1000))
+MESSAGE_WORKERS = int(os.environ.get('MESSAGE_WORKERS', 2))
 
 # SENSORS
 SENSOR_NAMES_SET = {
@@ -48,6 +115,42 @@ SENSOR_NAMES_SET = {
     'wattage_gpu__measure'
 }
 SORTED_SENSORS_LIST = sorted(list(SENSOR_NAMES_SET))
+SENSOR_MISSING_VALUE = -1 # stored for a sensor the message did not report
+
+# DEADBAND
+# with DEADBAND=1 a row is only stored once a sensor moved more than its tolerance from the last stored
+# row, or when a new DEADBAND_MAX_GAP_SECONDS window starts (aligned to the epoch, keep it a divisor of
+# the 1m rollup bucket); /metrics fills the dropped rows back with the last value and only aggregates
+# steps that are a multiple of DEADBAND_MAX_GAP_SECONDS.
+# the most specific key wins: sensor ('sys_cpu__clock'), device ('sys_cpu') then kind ('sys'), 0 otherwise.
+# override or add keys with DEADBAND_TOLERANCES='temp=1,fan_gpu=100'
+DEADBAND = os.environ.get('DEADBAND', '0') == '1'
+DEADBAND_MAX_GAP_SECONDS = int(os.environ.get('DEADBAND_MAX_GAP_SECONDS', 60))
+DEADBAND_TOLERANCES = {
+    'fan': 50, # rpm
+    'sys': 2, # %
+    'sys_cpu__clock': 50, # MHz
+    'sys_cpu__clock_core_max': 50,
+    'sys_cpu__clock_core_min': 50,
+    'sys_gpu__clock': 50,
+    'sys_gpu__mem_clock': 50,
+    'sys_mem__clock': 50,
+    'temp': 0.5, # C
+    'voltage': 0.02, # V
+    'wattage': 2 # W
+}
+for tolerance in filter(None, os.environ.get('DEADBAND_TOLERANCES', '').split(',')):
+    tolerance_key, tolerance_value = tolerance.split('=')
+    DEADBAND_TOLERANCES[tolerance_key.strip()] = float(tolerance_value)
+
+# DEVICES
+# topic -> (hostname, sensors that machine publishes); the hostname tags its rows and Timestream records.
+# more machines publishing the same HWiNFO ids: DEVICES='bedroom/htpc=HTPC,bedroom/laptop=Laptop'
+DEFAULT_HOST = 'Torrent7'
+DEVICES = {PC_PUBLISH_TOPIC: (DEFAULT_HOST, SORTED_SENSORS_LIST)}
+for device in filter(None, os.environ.get('DEVICES', '').split(',')):
+    device_topic, device_host = device.split('=')
+    DEVICES[device_topic.strip()] = (device_host.strip(), SORTED_SENSORS_LIST)
 
 # AWS
 AWS_PROFILE = 'test'
@@ -55,9 +158,37 @@ CONFIG_MAX_ATTEMPTS = 10
 CONFIG_MAX_POOL_CONNECTION = 5000
 CONFIG_READ_TIMEOUT = 20
 DATABASE_NAME = 'testsensors'
+EXPORT_BACKOFF_BASE_SECONDS = 0.5
+EXPORT_BACKOFF_MAX_SECONDS = 30
+EXPORT_CONCURRENCY = int(os.environ.get('EXPORT_CONCURRENCY', 4))
+EXPORT_FETCH_ROWS = 1000
+EXPORT_MAX_RETRIES = 5
+OUTBOX_BACKOFF_BASE_SECONDS = 60
+OUTBOX_BACKOFF_MAX_SECONDS = 60 * 60
 MAX_RECORDS_PER_WRITE = 100
 REGION_NAME = 'us-east-2'
 TABLE_NAME = 'multimetrics'
 
+# EXPORT
+# EXPORT_SINK 'timestream', 'file' (JSON lines appended to EXPORT_FILE, a local stand-in) or 'line'
+# (InfluxDB line protocol POSTed gzipped to EXPORT_URL over a kept-alive connection per upload worker)
+EXPORT_FILE = os.environ.get('EXPORT_FILE', os.path.join(DATABASE_DIR, 'export.jsonl'))
+EXPORT_GZIP_LEVEL = 1 # 6 shrinks a 3 MiB batch only 28% further at 2-3x the CPU
+EXPORT_KEYFRAME_ROWS = int(os.environ.get('EXPORT_KEYFRAME_ROWS', 60)) # 1 sends every value of every row
+EXPORT_MAX_BYTES_PER_WRITE = 4 * 1024 * 1024 # approximate, as JSON
+EXPORT_RECORDS_PER_WRITE = 5000 # file and line sinks, Timestream takes MAX_RECORDS_PER_WRITE
+EXPORT_SINK = os.environ.get('EXPORT_SINK', 'timestream')
+EXPORT_TOKEN = os.environ.get('EXPORT_TOKEN', '')
+EXPORT_URL = os.environ.get('EXPORT_URL', 'http://localhost:8086/api/v2/write?bucket=homestats&precision=ms')
+
 # FLASK
+# FLASK_SERVER 'waitress' (threaded WSGI server, HTTP/1.1 keep-alive) or 'werkzeug' (the development
+# server, FLASK_DEBUG only applies there); every /live stream holds one of the FLASK_THREADS threads
+FLASK_DEBUG = os.environ.get('FLASK_DEBUG', '0') == '1'
 FLASK_PORT = 3000
+FLASK_SERVER = os.environ.get('FLASK_SERVER', 'waitress')
+FLASK_THREADS = int(os.environ.get('FLASK_THREADS', 16))
+# one pooled read connection per request thread: a /metrics stream holds its connection until the
+# response is sent, with fewer a few slow downloads would leave every other query waiting for one
+SQLITE_READ_POOL_SIZE = FLASK_THREADS
+STREAM_CHUNK_ROWS = 1000
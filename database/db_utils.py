@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+from constants import (
+    DATABASE_FILE,
+    DEFAULT_HOST,
+    DT_FORMAT,
+    ROLLUPS,
+    SORTED_SENSORS_LIST,
+    SQLITE_ARCHIVE_PENDING_TABLE_NAME,
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE,
+    SQLITE_EXPORT_CURSOR_TABLE_NAME,
+    SQLITE_EXPORT_OUTBOX_TABLE_NAME,
+    SQLITE_MMAP_SIZE,
+    SQLITE_READ_POOL_SIZE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_TABLE_NAME
+)
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from rollup_utils import (
+    get_rollup_create_sql,
+    get_rollup_last_sql,
+    update_rollups
+)
+import queue
+import sqlite3
+import sys
+import time
+
+HOST_TIME_INDEX_NAME = f'idx_{SQLITE_TABLE_NAME}_host_time_ms'
+TIME_INDEX_NAME = f'idx_{SQLITE_TABLE_NAME}_time_ms'
+
+def get_db_conn(use_row = False, db_file = DATABASE_FILE, read_only = False):
+    if read_only:
+        db_conn = sqlite3.connect(f'file:{db_file}?mode=ro', uri=True, check_same_thread=False)
+    else:
+        db_conn = sqlite3.connect(db_file, check_same_thread=False)
+
+    db_conn.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}')
+    db_conn.execute(f'PRAGMA cache_size = {SQLITE_CACHE_SIZE}')
+    db_conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+    db_conn.execute(f'PRAGMA synchronous = {SQLITE_SYNCHRONOUS}')
+
+    if use_row:
+        db_conn.row_factory = sqlite3.Row
+
+    return db_conn
+
+class ReadPool:
+    # read-only connections reused across Flask request threads, in WAL mode
+    # readers never block the writer and connection setup is paid once
+    def __init__(self, size = SQLITE_READ_POOL_SIZE, db_file = DATABASE_FILE):
+        self.pool = queue.LifoQueue(maxsize=size)
+
+        for _ in range(size):
+            self.pool.put(get_db_conn(True, db_file=db_file, read_only=True))
+
+    @contextmanager
+    def connection(self):
+        db_conn = self.pool.get()
+        try:
+            yield db_conn
+        finally:
+            self.pool.put(db_conn)
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
+
+def get_epoch_ms(timestamp):
+    # fromisoformat is much cheaper than strptime, but before Python 3.11 it only takes 3 or 6
+    # fraction digits; strptime still parses any other DT_FORMAT timestamp
+    try:
+        dt_obj = datetime.fromisoformat(timestamp)
+    except ValueError:
+        dt_obj = datetime.strptime(timestamp, DT_FORMAT)
+    dt_obj = dt_obj.replace(tzinfo=timezone.utc)
+
+    return int(round(dt_obj.timestamp() * 1000))
+
+def get_since_ms(minutes):
+    return int(time.time() * 1000) - minutes * 60 * 1000
+
+def quote(value):
+    return "'" + value.replace("'", "''") + "'"
+
+def get_insert_sql(host = DEFAULT_HOST, extra_cols = ()):
+    # one statement per device with its host inlined,
+    # rows are positional: timestamp, time_ms, SORTED_SENSORS_LIST, then extra_cols
+    cols = ', '.join(SORTED_SENSORS_LIST + list(extra_cols))
+    vals = ', '.join(['?'] * (len(SORTED_SENSORS_LIST) + len(extra_cols)))
+
+    sql = f"""INSERT INTO {SQLITE_TABLE_NAME}
+        (
+            host,
+            timestamp,
+            time_ms,
+            {cols}
+        ) VALUES
+        (
+            {quote(host)},
+            ?,
+            ?,
+            {vals}
+        )
+    """
+
+    return sql
+
+def get_columns(db_conn, table = SQLITE_TABLE_NAME):
+    cursor = db_conn.cursor()
+    cursor.execute(f'PRAGMA table_info({table})')
+    columns = [row[1] for row in cursor.fetchall()]
+    cursor.close()
+
+    return columns
+
+def migrate_create_table(db_conn):
+    # original layout, kept as-is so old multisensors.db files and new ones converge
+    cols = map(lambda col: col + ' REAL NOT NULL', SORTED_SENSORS_LIST)
+    sql = ', '.join(cols)
+
+    db_conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SQLITE_TABLE_NAME} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            {sql}
+        )
+    """)
+
+def migrate_time_ms(db_conn):
+    if 'time_ms' in get_columns(db_conn):
+        return
+
+    cursor = db_conn.cursor()
+    cursor.execute(f'ALTER TABLE {SQLITE_TABLE_NAME} ADD COLUMN time_ms INTEGER NOT NULL DEFAULT 0')
+    cursor.execute(f"""
+        UPDATE {SQLITE_TABLE_NAME}
+        SET time_ms = CAST(round((julianday(timestamp) - 2440587.5) * 86400000) AS INTEGER)
+    """)
+    print(f'migrate_time_ms total: {cursor.rowcount}')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS {TIME_INDEX_NAME} ON {SQLITE_TABLE_NAME} (time_ms)')
+    cursor.close()
+
+def migrate_rollups(db_conn):
+    for table, _, _ in ROLLUPS:
+        db_conn.execute(get_rollup_create_sql(table))
+
+    # backfill needs every sensor column, the host and the samples in place on both sides
+    migrate_sensor_columns(db_conn)
+    migrate_host_column(db_conn)
+    migrate_samples_columns(db_conn)
+    update_rollups(db_conn, 0)
+
+def migrate_export_cursor(db_conn):
+    # high-watermark of rows acknowledged by each export target
+    db_conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SQLITE_EXPORT_CURSOR_TABLE_NAME} (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            last_time_ms INTEGER NOT NULL
+        )
+    """)
+
+def migrate_export_outbox(db_conn):
+    # batches that failed every retry, kept as zlib compressed JSON records until replayed
+    db_conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SQLITE_EXPORT_OUTBOX_TABLE_NAME} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            records BLOB NOT NULL,
+            attempts INTEGER NOT NULL,
+            next_attempt_ms INTEGER NOT NULL
+        )
+    """)
+
+def migrate_host_column(db_conn):
+    # rows stored before several machines were tracked all came from DEFAULT_HOST
+    if 'host' in get_columns(db_conn):
+        return
+
+    db_conn.execute(f'ALTER TABLE {SQLITE_TABLE_NAME} ADD COLUMN host TEXT NOT NULL DEFAULT {quote(DEFAULT_HOST)}')
+    db_conn.execute(f'CREATE INDEX IF NOT EXISTS {HOST_TIME_INDEX_NAME} ON {SQLITE_TABLE_NAME} (host, time_ms)')
+
+def migrate_host(db_conn):
+    migrate_host_column(db_conn)
+
+    # rollups keyed by bucket only are rebuilt keyed by (host, bucket)
+    for table, _, _ in ROLLUPS:
+        columns = get_columns(db_conn, table)
+        if 'host' in columns:
+            continue
+
+        print(f'migrate_host rebuilding: {table}')
+        db_conn.execute(f'ALTER TABLE {table} RENAME TO {table}__old')
+        db_conn.execute(get_rollup_create_sql(table))
+        cols = ', '.join(columns)
+        db_conn.execute(f'INSERT INTO {table} (host, {cols}) SELECT {quote(DEFAULT_HOST)}, {cols} FROM {table}__old')
+        db_conn.execute(f'DROP TABLE {table}__old')
+
+def migrate_samples_columns(db_conn):
+    # every row stored before the deadband stands for exactly one message
+    columns = get_columns(db_conn)
+    if 'samples' not in columns:
+        db_conn.execute(f'ALTER TABLE {SQLITE_TABLE_NAME} ADD COLUMN samples INTEGER NOT NULL DEFAULT 1')
+    if 'span_ms' not in columns:
+        db_conn.execute(f'ALTER TABLE {SQLITE_TABLE_NAME} ADD COLUMN span_ms INTEGER NOT NULL DEFAULT 0')
+
+def migrate_samples(db_conn):
+    migrate_samples_columns(db_conn)
+
+def migrate_archive_pending(db_conn):
+    # at most one row: the raw rows clear_local archived and has not finished deleting yet
+    db_conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SQLITE_ARCHIVE_PENDING_TABLE_NAME} (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            before_id INTEGER NOT NULL,
+            cutoff_ms INTEGER NOT NULL
+        )
+    """)
+
+def migrate_rollups_last(db_conn):
+    # last values were taken from an arbitrary row of the bucket; buckets older than the raw rows keep theirs
+    for table, bucket_ms, _ in ROLLUPS:
+        db_conn.execute(get_rollup_last_sql(table, bucket_ms))
+
+# append only: PRAGMA user_version is the number of migrations applied
+MIGRATIONS = [
+    migrate_create_table,
+    migrate_time_ms,
+    migrate_rollups,
+    migrate_export_cursor,
+    migrate_export_outbox,
+    migrate_host,
+    migrate_samples,
+    migrate_archive_pending,
+    migrate_rollups_last
+]
+
+def get_pragma(db_conn, name):
+    cursor = db_conn.cursor()
+    cursor.execute(f'PRAGMA {name}')
+    value = cursor.fetchone()[0]
+    cursor.close()
+
+    return value
+
+def get_user_version(db_conn):
+    return get_pragma(db_conn, 'user_version')
+
+def migrate_sensor_columns(db_conn):
+    # SENSOR_NAMES_SET only ever grows, older rows read -1 like an unreported sensor
+    columns = set(get_columns(db_conn))
+    missing = [col for col in SORTED_SENSORS_LIST if col not in columns]
+
+    for col in missing:
+        print(f'migrate_sensor_columns adding: {col}')
+        db_conn.execute(f'ALTER TABLE {SQLITE_TABLE_NAME} ADD COLUMN {col} REAL NOT NULL DEFAULT -1')
+
+    for table, _, _ in ROLLUPS:
+        columns = set(get_columns(db_conn, table))
+
+        # rollup tables are created by a later migration
+        if len(columns) == 0:
+            continue
+
+        for col in SORTED_SENSORS_LIST:
+            for suffix in ['sum', 'min', 'max', 'last']:
+                if f'{col}__{suffix}' not in columns:
+                    db_conn.execute(f'ALTER TABLE {table} ADD COLUMN {col}__{suffix} REAL')
+
+def migrate_sql_table(db_conn):
+    user_version = get_user_version(db_conn)
+
+    for version in range(user_version, len(MIGRATIONS)):
+        migration = MIGRATIONS[version]
+        print(f'migrate_sql_table {version + 1}: {migration.__name__}')
+
+        db_conn.execute('BEGIN')
+        try:
+            migration(db_conn)
+            db_conn.execute(f'PRAGMA user_version = {version + 1}')
+            db_conn.commit()
+        except Exception:
+            db_conn.rollback()
+            raise
+
+    db_conn.execute('BEGIN')
+    migrate_sensor_columns(db_conn)
+    db_conn.commit()
+
+def init_auto_vacuum(db_conn):
+    # lets clear_local hand free pages back with PRAGMA incremental_vacuum; an existing
+    # file only switches mode with a full VACUUM, which therefore runs once here
+    if get_pragma(db_conn, 'auto_vacuum') == 2:
+        return
+
+    db_conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    if len(get_columns(db_conn)) == 0:
+        return
+
+    # VACUUM cannot change the mode of a file in WAL mode, the conversion runs with a rollback journal;
+    # leaving WAL needs the only connection to the file, otherwise the next start tries again
+    journal_mode = get_pragma(db_conn, 'journal_mode')
+    if journal_mode == 'wal':
+        try:
+            left_wal = get_pragma(db_conn, 'journal_mode = DELETE') != 'wal'
+        except sqlite3.OperationalError:
+            left_wal = False
+        if not left_wal:
+            print('init_auto_vacuum skipped: database file in use')
+            return
+
+    print('init_auto_vacuum converting database file')
+    db_conn.execute('VACUUM')
+    db_conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+
+def init_sql_table(db_file = DATABASE_FILE):
+    print(f'init_sql_table started')
+
+    db_conn = get_db_conn(db_file=db_file)
+    init_auto_vacuum(db_conn)
+    migrate_sql_table(db_conn)
+    db_conn.execute('PRAGMA journal_mode = WAL')
+
+    print(f'init_sql_table completed')
+
+    return db_conn
+
+if __name__ == '__main__':
+    # migrate an existing database file in place: python db_utils.py [multisensors.db]
+    db_file = sys.argv[1] if len(sys.argv) > 1 else DATABASE_FILE
+    db_conn = get_db_conn(db_file=db_file)
+    migrate_sql_table(db_conn)
+    db_conn.close()
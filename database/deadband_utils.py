@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+from archive_utils import format_timestamps
+from constants import (
+    DEADBAND_MAX_GAP_SECONDS,
+    DEADBAND_TOLERANCES,
+    DEFAULT_HOST,
+    SORTED_SENSORS_LIST,
+    SQLITE_SAMPLES_COLUMNS
+)
+from db_utils import get_insert_sql
+
+def get_tolerances(tolerances = DEADBAND_TOLERANCES):
+    # one per SORTED_SENSORS_LIST column, the most specific key wins
+    result = []
+
+    for col in SORTED_SENSORS_LIST:
+        device = col.split('__')[0]
+        kind = device.split('_')[0]
+        keys = [key for key in [col, device, kind] if key in tolerances]
+        result.append(tolerances[keys[0]] if len(keys) > 0 else 0)
+
+    return result
+
+class Deadband:
+    # decides per message whether its row is stored. a stored row is held back until the next one is
+    # stored, so it can carry how many messages it stands for (samples, itself included) and the time
+    # from it to the last of them (span_ms); rollups weigh rows by samples, iter_filled_chunks expands them.
+    # the first message of every max_gap_seconds window (aligned like the rollup buckets) is always
+    # stored, so a row never stands for messages in another bucket.
+    # one per topic, each topic's messages are handled by a single message worker
+    def __init__(self, host = DEFAULT_HOST, tolerances = DEADBAND_TOLERANCES, max_gap_seconds = DEADBAND_MAX_GAP_SECONDS):
+        self.sql = get_insert_sql(host, SQLITE_SAMPLES_COLUMNS)
+        self.tolerances = get_tolerances(tolerances)
+        self.max_gap_ms = max_gap_seconds * 1000
+        self.held = None
+        self.samples = 0
+        self.last_ms = None
+
+    def changed(self, row):
+        for value, held_value, tolerance in zip(row[2:], self.held[2:], self.tolerances):
+            # a sensor appearing or disappearing (-1) is always a change
+            if abs(value - held_value) > tolerance:
+                return True
+
+        return False
+
+    def put(self, row):
+        # row as built by PayloadDecoder, returns the row to store now (for self.sql) or None
+        held = self.held
+        if held is not None and row[1] // self.max_gap_ms == held[1] // self.max_gap_ms and not self.changed(row):
+            self.samples += 1
+            self.last_ms = max(self.last_ms, row[1])
+            return None
+
+        stored = self.flush()
+        self.held = row
+        self.samples = 1
+        self.last_ms = row[1]
+
+        return stored
+
+    def flush(self):
+        # the held row, on shutdown it has to be written too
+        if self.held is None:
+            return None
+
+        stored = list(self.held) + [self.samples, self.last_ms - self.held[1]]
+        self.held = None
+
+        return stored
+
+def get_window_ms(since_ms, max_gap_seconds = DEADBAND_MAX_GAP_SECONDS):
+    # a stored row can stand for messages up to the end of its window: reads start at the window
+    # containing since_ms and drop the filled rows before since_ms
+    max_gap_ms = max_gap_seconds * 1000
+
+    return since_ms - since_ms % max_gap_ms
+
+def iter_filled_chunks(chunks, since_ms = None, tail = None):
+    # chunks of rows (timestamp, time_ms, ..., samples, span_ms) -> the rows they stand for, without the
+    # two trailing columns: a row with samples > 1 is repeated at even steps over its span (last-value fill).
+    # rows before since_ms are dropped, tail(after_ms) returns the rows newer than the last one to end with
+    last_ms = None if since_ms is None else since_ms - 1
+
+    for chunk in chunks:
+        filled = []
+
+        for row in chunk:
+            samples = int(row[-2])
+            filled.append(row[:-2])
+            if samples > 1:
+                time_ms = row[1]
+                span_ms = row[-1]
+                values = row[2:-2]
+                times = [int(time_ms + span_ms * index // (samples - 1)) for index in range(1, samples)]
+                filled.extend((timestamp, filled_ms, *values) for timestamp, filled_ms in zip(format_timestamps(times), times))
+
+        if since_ms is not None:
+            filled = [row for row in filled if row[1] >= since_ms]
+        if len(filled) > 0:
+            last_ms = filled[-1][1]
+
+        yield filled
+
+    if tail is not None:
+        yield tail(last_ms)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+from constants import (
+    DEFAULT_HOST,
+    SORTED_SENSORS_LIST
+)
+from db_utils import (
+    get_epoch_ms,
+    get_insert_sql
+)
+import json
+
+# optional faster parser, reads the raw payload bytes without decoding them first
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def loads(payload):
+    if orjson is not None:
+        return orjson.loads(payload)
+
+    return json.loads(payload.decode('utf-8'))
+
+class PayloadDecoder:
+    # everything that does not depend on the message is built once; cols are the sensors the
+    # device publishes, rows always hold every SORTED_SENSORS_LIST column (-1 for the others)
+    def __init__(self, cols = SORTED_SENSORS_LIST, host = DEFAULT_HOST):
+        self.host = host
+        self.sql = get_insert_sql(host)
+        self.index = {col: SORTED_SENSORS_LIST.index(col) + 2 for col in cols}
+        self.template = [None, None] + [-1] * len(SORTED_SENSORS_LIST)
+
+    def decode(self, payload):
+        # returns the row in insert order: timestamp, time_ms, then the sensors (-1 when missing)
+        payloadJson = loads(payload)
+        timestamp = payloadJson['sent']
+
+        row = self.template.copy()
+        row[0] = timestamp
+        row[1] = get_epoch_ms(timestamp)
+
+        index = self.index
+        for each in payloadJson['payload']:
+            position = index.get(each['Id'])
+            if position is not None:
+                row[position] = each['Value']
+
+        return row
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+
+from aws_utils import (
+    prepare_common_attributes,
+    prepare_dimensions
+)
+from concurrent.futures import ThreadPoolExecutor
+from constants import (
+    EXPORT_BACKOFF_BASE_SECONDS,
+    EXPORT_BACKOFF_MAX_SECONDS,
+    EXPORT_CONCURRENCY,
+    EXPORT_FETCH_ROWS,
+    EXPORT_KEYFRAME_ROWS,
+    EXPORT_MAX_RETRIES,
+    MAX_RECORDS_PER_WRITE,
+    OUTBOX_BACKOFF_BASE_SECONDS,
+    OUTBOX_BACKOFF_MAX_SECONDS,
+    SENSOR_MISSING_VALUE,
+    SORTED_SENSORS_LIST,
+    SQLITE_EXPORT_CURSOR_TABLE_NAME,
+    SQLITE_EXPORT_OUTBOX_TABLE_NAME,
+    SQLITE_TABLE_NAME
+)
+from db_utils import get_since_ms
+from sink_utils import (
+    RejectedRecordsError,
+    ThrottlingError,
+    get_sink,
+    merge_attributes,
+    print_rejected_records
+)
+from stats_utils import (
+    EXPORT_BATCH_SECONDS,
+    EXPORT_RECORDS,
+    EXPORT_THROTTLED
+)
+import collections
+import json
+import random
+import threading
+import time
+import zlib
+
+def get_export_cursor(db_conn, name = None):
+    # one cursor per sink (see sink_utils.py), the configured one by default
+    if name is None:
+        name = get_sink().name
+
+    cursor = db_conn.cursor()
+    cursor.execute(f'SELECT last_id FROM {SQLITE_EXPORT_CURSOR_TABLE_NAME} WHERE name = ?', (name,))
+    row = cursor.fetchone()
+
+    if row is None:
+        # first run against this target: the hourly export already covered everything older than an hour
+        cursor.execute(f'SELECT COALESCE(max(id), 0) FROM {SQLITE_TABLE_NAME} WHERE time_ms < ?', (get_since_ms(60),))
+        row = cursor.fetchone()
+        print(f'get_export_cursor initialized: {row[0]}')
+
+    cursor.close()
+
+    return row[0]
+
+def set_export_cursor(db_conn, last_id, last_time_ms, name = None):
+    if name is None:
+        name = get_sink().name
+
+    db_conn.execute(f"""
+        INSERT INTO {SQLITE_EXPORT_CURSOR_TABLE_NAME} (name, last_id, last_time_ms)
+        VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            last_id = excluded.last_id,
+            last_time_ms = excluded.last_time_ms
+    """, (name, last_id, last_time_ms))
+    db_conn.commit()
+
+DIMENSIONS = {}
+# rough JSON size of a record and of each measure besides its name and value, for max_bytes
+RECORD_BYTES = 50
+MEASURE_BYTES = 40
+
+def iter_rows(db_conn, after_id, fetch_rows = EXPORT_FETCH_ROWS):
+    # short keyset reads by id, no statement stays open across the cursor commits
+    cols = ', '.join(SORTED_SENSORS_LIST)
+    sql = f'SELECT id, time_ms, host, {cols} FROM {SQLITE_TABLE_NAME} WHERE id > ? ORDER BY id LIMIT ?'
+
+    while True:
+        cursor = db_conn.cursor()
+        cursor.execute(sql, (after_id, fetch_rows))
+        rows = cursor.fetchall()
+        cursor.close()
+
+        if len(rows) == 0:
+            return
+
+        yield from rows
+        after_id = rows[-1][0]
+
+def format_value(value):
+    # '45' rather than '45.0' for the many whole-number readings (clocks, RPMs, percentages)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+
+    return repr(value)
+
+class RecordEncoder:
+    # compact MULTI records: -1 placeholders are left out, and so is any value equal to the last one
+    # sent for that host, except on every keyframe_rows-th row of a host (the first one included),
+    # so a reader filling forward from the last value never needs to look back further than that.
+    # rows where nothing is left to send produce no record at all
+    def __init__(self, keyframe_rows = EXPORT_KEYFRAME_ROWS):
+        self.keyframe_rows = keyframe_rows
+        self.last_values = {}
+        self.rows = {}
+
+    def encode(self, row):
+        # returns (host, record without Dimensions, estimated bytes) or None
+        sqlite_id, time, host, *rest = row
+
+        last_values = self.last_values.get(host)
+        rows = self.rows.get(host, 0)
+        if last_values is None or rows % self.keyframe_rows == 0:
+            last_values = [None] * len(rest)
+        self.last_values[host] = rest
+        self.rows[host] = rows + 1
+
+        measures = []
+        size = RECORD_BYTES
+        for metric, value, last_value in zip(SORTED_SENSORS_LIST, rest, last_values):
+            if value == SENSOR_MISSING_VALUE or value == last_value:
+                continue
+            value = format_value(value)
+            measures.append({'Name': metric, 'Value': value, 'Type': 'DOUBLE'})
+            size += MEASURE_BYTES + len(metric) + len(value)
+
+        if len(measures) == 0:
+            return None
+
+        record = {
+            'Time': str(time),
+            'MeasureValues': measures
+        }
+
+        return host, record, size
+
+def get_dimensions(host):
+    # one dimensions list per host, shared by its records
+    if host not in DIMENSIONS:
+        DIMENSIONS[host] = prepare_dimensions(host)
+
+    return DIMENSIONS[host]
+
+def finish_batch(hosts, records):
+    # a batch from a single host carries its dimension once, in the CommonAttributes
+    common_attributes = prepare_common_attributes()
+
+    if len(set(hosts)) == 1:
+        common_attributes['Dimensions'] = get_dimensions(hosts[0])
+    else:
+        for host, record in zip(hosts, records):
+            record['Dimensions'] = get_dimensions(host)
+
+    return common_attributes
+
+def iter_batches(rows, size = MAX_RECORDS_PER_WRITE, max_bytes = None, encoder = None):
+    # yields (first id, last id, last time_ms, records, common attributes), only one batch is materialized
+    # at a time; a batch closes at size records or, when the sink has a payload limit, at about max_bytes.
+    # rows after the last record are left for the next export, which sends them as a keyframe
+    if encoder is None:
+        encoder = RecordEncoder()
+
+    hosts = []
+    batch = []
+    batch_bytes = 0
+    first_id = None
+
+    for row in rows:
+        if first_id is None:
+            first_id = row[0]
+
+        encoded = encoder.encode(row)
+        if encoded is None:
+            continue
+
+        host, record, record_bytes = encoded
+        if max_bytes is not None and len(batch) > 0 and batch_bytes + record_bytes > max_bytes:
+            yield first_id, last_id, last_time_ms, batch, finish_batch(hosts, batch)
+            hosts = []
+            batch = []
+            batch_bytes = 0
+            first_id = row[0]
+
+        hosts.append(host)
+        batch.append(record)
+        batch_bytes += record_bytes
+        last_id = row[0]
+        last_time_ms = row[1]
+
+        if len(batch) == size:
+            yield first_id, last_id, last_time_ms, batch, finish_batch(hosts, batch)
+            hosts = []
+            batch = []
+            batch_bytes = 0
+            first_id = None
+
+    if len(batch) > 0:
+        yield first_id, last_id, last_time_ms, batch, finish_batch(hosts, batch)
+
+class Backoff:
+    # shared by every upload worker: throttling doubles the delay, successes halve it
+    def __init__(self, base = EXPORT_BACKOFF_BASE_SECONDS, maximum = EXPORT_BACKOFF_MAX_SECONDS):
+        self.base = base
+        self.maximum = maximum
+        self.delay = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        delay = self.delay
+        if delay > 0:
+            time.sleep(delay * random.uniform(0.5, 1))
+
+    def failed(self):
+        with self.lock:
+            self.delay = min(self.maximum, max(self.base, self.delay * 2))
+
+    def succeeded(self):
+        with self.lock:
+            self.delay = self.delay / 2 if self.delay > self.base else 0
+
+def write_records(sink, records, common_attributes, backoff):
+    with EXPORT_BATCH_SECONDS.time():
+        remaining = write_records_retrying(sink, records, common_attributes, backoff)
+
+    EXPORT_RECORDS['failed'].inc(len(remaining))
+
+    return remaining
+
+def write_records_retrying(sink, records, common_attributes, backoff):
+    # returns the records still not acknowledged after every retry. only failures are retried: a rejected
+    # record is either already stored (ExistingVersion) or will never be accepted, e.g. its time fell out of
+    # the memory store window during a long outage, so it is logged and dropped
+    for attempt in range(EXPORT_MAX_RETRIES + 1):
+        backoff.wait()
+
+        try:
+            sink.write(records, common_attributes)
+            backoff.succeeded()
+            EXPORT_RECORDS['written'].inc(len(records))
+            return []
+        except RejectedRecordsError as err:
+            print(f'RejectedRecords: {err}')
+            print_rejected_records(err.rejected)
+            backoff.succeeded()
+            dropped = sum(1 for rr in err.rejected if 'ExistingVersion' not in rr)
+            EXPORT_RECORDS['written'].inc(len(records) - dropped)
+            EXPORT_RECORDS['rejected'].inc(dropped)
+            return []
+        except ThrottlingError as err:
+            print(f'write_records throttled: {err}')
+            EXPORT_THROTTLED.inc()
+            backoff.failed()
+        except Exception as err:
+            print(f'write_records error: {err}')
+            backoff.failed()
+
+        print(f'write_records retrying {len(records)} records, attempt: {attempt + 1}')
+
+    return records
+
+def get_outbox_next_attempt_ms(attempts):
+    delay = min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+
+    return get_since_ms(0) + int(delay * 1000)
+
+def add_outbox(db_conn, first_id, last_id, records):
+    db_conn.execute(f"""
+        INSERT INTO {SQLITE_EXPORT_OUTBOX_TABLE_NAME} (first_id, last_id, records, attempts, next_attempt_ms)
+        VALUES (?, ?, ?, 1, ?)
+    """, (first_id, last_id, zlib.compress(json.dumps(records).encode('utf-8')), get_outbox_next_attempt_ms(1)))
+
+def get_pending_id(db_conn):
+    # lowest row id not yet exported, retention must keep it and everything after. rows behind the
+    # cursor are either acknowledged or parked in the outbox, which holds its own copy of the records
+    return get_export_cursor(db_conn) + 1
+
+def export_rows(db_conn, sink, concurrency = EXPORT_CONCURRENCY, stopping = None):
+    # rows -> records -> batches are built lazily and at most one batch per worker is in flight;
+    # the cursor moves past a batch once it is acknowledged or parked in the outbox, in batch order.
+    # after the first batch that ends up in the outbox, or once stopping is set, no new batches are started
+    last_id = get_export_cursor(db_conn, sink.name)
+    print(f'export_rows {sink.name} from id: {last_id}, concurrency: {concurrency}')
+
+    backoff = Backoff()
+    in_flight = collections.deque()
+    total = 0
+    failed = False
+
+    def acknowledge():
+        nonlocal failed, total
+        batch_first_id, batch_last_id, batch_last_time_ms, count, common_attributes, future = in_flight.popleft()
+
+        remaining = future.result()
+        with db_conn:
+            if len(remaining) > 0:
+                print(f'export_rows outbox: ids {batch_first_id}-{batch_last_id}, records: {len(remaining)}')
+                # parked records carry their hoisted attributes again, the outbox replays them on their own
+                add_outbox(db_conn, batch_first_id, batch_last_id, [merge_attributes(record, common_attributes) for record in remaining])
+                failed = True
+            set_export_cursor(db_conn, batch_last_id, batch_last_time_ms, sink.name)
+        total += count - len(remaining)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        batches = iter_batches(iter_rows(db_conn, last_id), sink.max_records, sink.max_bytes)
+        for first_id, batch_last_id, batch_last_time_ms, records, common_attributes in batches:
+            future = executor.submit(write_records, sink, records, common_attributes, backoff)
+            in_flight.append((first_id, batch_last_id, batch_last_time_ms, len(records), common_attributes, future))
+
+            if len(in_flight) >= concurrency:
+                acknowledge()
+
+            if failed or (stopping is not None and stopping.is_set()):
+                break
+
+        while len(in_flight) > 0:
+            acknowledge()
+
+    return total
+
+def replay_outbox_round(db_conn, sink, concurrency, due_ms = None, skip_ids = ()):
+    # entries due by due_ms, every entry with None; returns (entries that went through, ids of every entry tried)
+    cursor = db_conn.cursor()
+    cursor.execute(f"""
+        SELECT id, records, attempts FROM {SQLITE_EXPORT_OUTBOX_TABLE_NAME}
+        WHERE ? IS NULL OR next_attempt_ms <= ? ORDER BY id
+    """, (due_ms, due_ms))
+    entries = [entry for entry in cursor.fetchall() if entry[0] not in skip_ids]
+    cursor.close()
+
+    if len(entries) == 0:
+        return 0, []
+
+    backoff = Backoff()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = []
+        for outbox_id, records, attempts in entries:
+            records = json.loads(zlib.decompress(records).decode('utf-8'))
+            futures.append((outbox_id, attempts, executor.submit(write_records, sink, records, prepare_common_attributes(), backoff)))
+
+        succeeded = 0
+        for outbox_id, attempts, future in futures:
+            remaining = future.result()
+            with db_conn:
+                if len(remaining) == 0:
+                    db_conn.execute(f'DELETE FROM {SQLITE_EXPORT_OUTBOX_TABLE_NAME} WHERE id = ?', (outbox_id,))
+                    succeeded += 1
+                else:
+                    db_conn.execute(f"""
+                        UPDATE {SQLITE_EXPORT_OUTBOX_TABLE_NAME}
+                        SET records = ?, attempts = ?, next_attempt_ms = ?
+                        WHERE id = ?
+                    """, (
+                        zlib.compress(json.dumps(remaining).encode('utf-8')),
+                        attempts + 1,
+                        get_outbox_next_attempt_ms(attempts + 1),
+                        outbox_id
+                    ))
+
+    return succeeded, [outbox_id for outbox_id, _, _ in entries]
+
+def replay_outbox(userdata):
+    # due entries are replayed concurrently; once one goes through the remote is reachable again,
+    # so every other entry is tried too without waiting out its backoff. an entry that still fails
+    # keeps its backoff and does not stop the others
+    db_conn = userdata['db_conn']
+    sink = get_sink()
+
+    total, tried_ids = replay_outbox_round(db_conn, sink, EXPORT_CONCURRENCY, get_since_ms(0))
+    if total > 0:
+        succeeded, _ = replay_outbox_round(db_conn, sink, EXPORT_CONCURRENCY, skip_ids=set(tried_ids))
+        total += succeeded
+
+    if total > 0:
+        print(f'replay_outbox total: {total}')
+
+def publish_remote(userdata):
+    print('publish_remote started')
+    db_conn = userdata['db_conn']
+
+    total = export_rows(db_conn, get_sink(), stopping=userdata.get('stopping'))
+
+    print(f'publish_remote total: {total}')
+    print('publish_remote completed')
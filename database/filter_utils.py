@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+from constants import SORTED_SENSORS_LIST
+
+SENSOR_INDEX = {col: index for index, col in enumerate(SORTED_SENSORS_LIST)}
+
+def get_sensor_groups():
+    # 'temp_gpu__hotspot' belongs to 'temp' and 'temp_gpu'
+    groups = {}
+
+    for col in SORTED_SENSORS_LIST:
+        device = col.split('__')[0]
+        kind = device.split('_')[0]
+
+        for group in {kind, device}:
+            groups.setdefault(group, []).append(col)
+
+    return groups
+
+SENSOR_GROUPS = get_sensor_groups()
+
+def resolve_sensors(filter_group, filter_sensor):
+    # comma separated values, '*' means everything; returns (columns, unknown values)
+    if filter_group == '*' and filter_sensor == '*':
+        return SORTED_SENSORS_LIST, []
+
+    selected = set()
+    unknown = []
+
+    if filter_group != '*':
+        for group in filter_group.split(','):
+            group = group.strip()
+            if group in SENSOR_GROUPS:
+                selected.update(SENSOR_GROUPS[group])
+            else:
+                unknown.append(group)
+
+    if filter_sensor != '*':
+        for sensor in filter_sensor.split(','):
+            sensor = sensor.strip()
+            if sensor in SENSOR_INDEX:
+                selected.add(sensor)
+            else:
+                unknown.append(sensor)
+
+    return sorted(selected, key=SENSOR_INDEX.get), unknown
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import ThreadPoolExecutor
+from constants import (
+    DATABASE_FILE,
+    JOB_WORKERS
+)
+from db_utils import get_db_conn
+from export_utils import (
+    publish_remote,
+    replay_outbox
+)
+from retention_utils import clear_local
+from stats_utils import (
+    Counter,
+    Histogram
+)
+import threading
+import time
+
+class Job:
+    # runs at every multiple of interval_seconds since the epoch, plus offset_seconds
+    # (3600, 300 is five past every hour in UTC); never twice at the same time
+    def __init__(self, name, func, interval_seconds, offset_seconds = 0):
+        self.name = name
+        self.func = func
+        self.interval = interval_seconds
+        self.offset = offset_seconds
+        self.running = False
+        self.next_run = self.get_next_run(time.time())
+
+        self.seconds = Histogram('homestats_job_seconds', 'Scheduled job run time', {'job': name})
+        self.runs = {
+            result: Counter('homestats_job_runs_total', 'Scheduled job runs by outcome', {'job': name, 'result': result})
+            for result in ['ok', 'error', 'skipped']
+        }
+
+    def get_next_run(self, now):
+        # from the schedule, not from when the last run ended, so runs never drift
+        return ((now - self.offset) // self.interval + 1) * self.interval + self.offset
+
+class JobRunner:
+    # one thread keeps the schedule, jobs run on a fixed pool of workers. every run gets its own
+    # SQLite connection as userdata['db_conn'] and can watch userdata['stopping'] to end early
+    def __init__(self, userdata, workers = JOB_WORKERS, db_file = DATABASE_FILE):
+        self.userdata = userdata
+        self.db_file = db_file
+        self.jobs = []
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+
+    def add(self, name, func, interval_seconds, offset_seconds = 0):
+        job = Job(name, func, interval_seconds, offset_seconds)
+        self.jobs.append(job)
+
+        print(f'JobRunner {name} every {interval_seconds}s, next at {time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(job.next_run))}')
+
+    def run(self):
+        # blocks until stop() is called
+        while not self.stopping.is_set():
+            now = time.time()
+
+            for job in self.jobs:
+                if job.next_run <= now:
+                    self.submit(job)
+                    job.next_run = job.get_next_run(now)
+
+            # with no jobs added this only waits to be stopped
+            next_run = min((job.next_run for job in self.jobs), default=now + 60)
+            self.stopping.wait(max(0, next_run - time.time()))
+
+    def submit(self, job):
+        with self.lock:
+            if job.running:
+                # single flight: a run still going when the next one is due means that one is skipped
+                print(f'JobRunner {job.name} still running, skipped')
+                job.runs['skipped'].inc()
+                return
+            job.running = True
+
+        self.executor.submit(self.execute, job)
+
+    def execute(self, job):
+        db_conn = get_db_conn(db_file=self.db_file)
+        userdata = dict(self.userdata, db_conn=db_conn, stopping=self.stopping)
+
+        try:
+            with job.seconds.time():
+                job.func(userdata)
+            job.runs['ok'].inc()
+        except Exception as err:
+            print(f'JobRunner {job.name} error: {err}')
+            job.runs['error'].inc()
+        finally:
+            db_conn.close()
+            with self.lock:
+                job.running = False
+
+    def stop(self):
+        # no new runs; running ones are told through userdata['stopping'] and waited for
+        self.stopping.set()
+        self.executor.shutdown(wait=True)
+
+def add_jobs(runner):
+    # the same schedule in the ingest process (JOBS='app') or in database-cron, aligned to UTC:
+    # every hour on the hour, every day at 03:30, every minute at :30
+    runner.add('publish_remote', publish_remote, 60 * 60)
+    runner.add('clear_local', clear_local, 24 * 60 * 60, 3 * 60 * 60 + 30 * 60)
+    runner.add('replay_outbox', replay_outbox, 60, 30)
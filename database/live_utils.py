@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+from constants import (
+    LIVE_BUFFER_SIZE,
+    LIVE_KEEPALIVE_SECONDS,
+    LIVE_MAX_SUBSCRIBERS
+)
+from filter_utils import SENSOR_INDEX
+from response_utils import dumps
+import collections
+import threading
+
+class Subscriber:
+    # bounded per-client buffer: a slow client loses its oldest rows, never slows down ingestion
+    def __init__(self, host, cols, size = LIVE_BUFFER_SIZE):
+        self.host = host
+        self.cols = cols
+        self.indexes = [SENSOR_INDEX[col] + 2 for col in cols]
+        self.rows = collections.deque(maxlen=size)
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.last = None
+
+    def put(self, row):
+        with self.condition:
+            if len(self.rows) == self.rows.maxlen:
+                self.dropped += 1
+            self.rows.append(row)
+            self.condition.notify()
+
+    def get(self, timeout):
+        # returns the buffered rows, [] after timeout without any
+        with self.condition:
+            if len(self.rows) == 0:
+                self.condition.wait(timeout)
+
+            rows = list(self.rows)
+            self.rows.clear()
+
+        return rows
+
+    def get_delta(self, row):
+        # timestamp, time_ms and only the sensors that changed since the last row sent to this client,
+        # the first row is sent whole
+        values = [row[index] for index in self.indexes]
+        last = self.last
+        self.last = values
+
+        delta = {'timestamp': row[0], 'time_ms': row[1]}
+        for index, col in enumerate(self.cols):
+            if last is None or last[index] != values[index]:
+                delta[col] = values[index]
+
+        return delta
+
+class Broadcaster:
+    def __init__(self, max_subscribers = LIVE_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, host, cols):
+        # None when every slot is taken
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+
+            subscriber = Subscriber(host, cols)
+            # copy on write, publish iterates without the lock
+            self.subscribers = self.subscribers + [subscriber]
+
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers = [each for each in self.subscribers if each is not subscriber]
+
+    def publish(self, host, row):
+        for subscriber in self.subscribers:
+            if subscriber.host == host:
+                subscriber.put(row)
+
+    def get_dropped(self):
+        return sum(subscriber.dropped for subscriber in self.subscribers)
+
+def iter_events(broadcaster, subscriber, keepalive_seconds = LIVE_KEEPALIVE_SECONDS):
+    # Server-Sent Events: one 'sample' event per row, a 'dropped' event when rows were lost;
+    # runs until the client goes away (the next write then fails and the generator is closed)
+    dropped = 0
+    try:
+        yield b'retry: 5000\n\n'
+
+        while True:
+            rows = subscriber.get(keepalive_seconds)
+            if len(rows) == 0:
+                yield b': keepalive\n\n'
+                continue
+
+            if subscriber.dropped != dropped:
+                yield b'event: dropped\ndata: ' + dumps({'dropped': subscriber.dropped - dropped}) + b'\n\n'
+                dropped = subscriber.dropped
+
+            yield b''.join(
+                b'id: %d\nevent: sample\ndata: %s\n\n' % (row[1], dumps(subscriber.get_delta(row)))
+                for row in rows
+            )
+    finally:
+        broadcaster.unsubscribe(subscriber)
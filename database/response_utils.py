@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+from constants import STREAM_CHUNK_ROWS
+from deadband_utils import iter_filled_chunks
+import itertools
+import json
+
+# optional faster encoders, the service works without them
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MIMETYPES = {
+    'json': 'application/json',
+    'rows': 'application/json'
+}
+if msgpack is not None:
+    MIMETYPES['msgpack'] = 'application/x-msgpack'
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def get_columns(cols):
+    return ['timestamp', 'time_ms'] + cols
+
+def encode_chunks(columns, chunks, fmt):
+    # json: [{...}, ...]
+    # rows: {"columns": [...], "rows": [[...], ...]}
+    # msgpack: {"columns": [...]} followed by one array per row, read with msgpack.Unpacker
+    if fmt == 'msgpack':
+        packer = msgpack.Packer()
+        yield packer.pack({'columns': columns})
+        for chunk in chunks:
+            yield b''.join(packer.pack(row) for row in chunk)
+        return
+
+    yield b'{"columns":' + dumps(columns) + b',"rows":[' if fmt == 'rows' else b'['
+
+    first = True
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+
+        if fmt == 'json':
+            chunk = [dict(zip(columns, row)) for row in chunk]
+
+        # encode the chunk as a list and drop its brackets
+        body = dumps(chunk)[1:-1]
+        yield body if first else b',' + body
+        first = False
+
+    yield b']}' if fmt == 'rows' else b']'
+
+def encode_dicts(rows, columns, fmt):
+    if fmt == 'json':
+        return dumps(rows)
+
+    values = [[row[col] for col in columns] for row in rows]
+
+    return b''.join(encode_chunks(columns, [values], fmt))
+
+def iter_cursor_chunks(cursor):
+    while True:
+        chunk = cursor.fetchmany(STREAM_CHUNK_ROWS)
+        if len(chunk) == 0:
+            break
+
+        yield chunk
+
+def stream_query(read_pool, sql, params, columns, fmt, head_chunks = (), fill = False, since_ms = None, tail = None):
+    # head_chunks (archived rows) are sent before the query rows; with fill, rows end with
+    # samples and span_ms and are expanded by iter_filled_chunks (since_ms and tail go there).
+    # the pooled connection is held until the response is fully sent or aborted
+    with read_pool.connection() as db_conn:
+        cursor = db_conn.cursor()
+        cursor.row_factory = None
+        try:
+            cursor.execute(sql, params)
+            chunks = itertools.chain(head_chunks, iter_cursor_chunks(cursor))
+            if fill:
+                chunks = iter_filled_chunks(chunks, since_ms, tail)
+            yield from encode_chunks(columns, chunks, fmt)
+        finally:
+            cursor.close()
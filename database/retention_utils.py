@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+from archive_utils import archive_rows
+from constants import (
+    RETENTION_CHUNK_ROWS,
+    RETENTION_DAYS,
+    RETENTION_PAUSE_SECONDS,
+    RETENTION_VACUUM_PAGES,
+    ROLLUPS,
+    SQLITE_ARCHIVE_PENDING_TABLE_NAME,
+    SQLITE_TABLE_NAME
+)
+from db_utils import (
+    get_pragma,
+    get_since_ms
+)
+from export_utils import get_pending_id
+from stats_utils import (
+    CLEAR_LOCAL_ROWS,
+    CLEAR_LOCAL_SECONDS
+)
+import time
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+def get_retention_cutoff_ms(days, now_ms):
+    return now_ms - int(days * DAY_MS)
+
+def is_stopping(stopping):
+    return stopping is not None and stopping.is_set()
+
+def delete_chunked(db_conn, table, key, where, params, chunk_rows = RETENTION_CHUNK_ROWS, pause_seconds = RETENTION_PAUSE_SECONDS, stopping = None):
+    # deletes the oldest chunk_rows matching rows per transaction, walking the primary key so
+    # each chunk only touches the rows it removes, and lets other writers in between chunks.
+    # once stopping is set it returns after the current chunk
+    sql = f'DELETE FROM {table} WHERE {key} IN (SELECT {key} FROM {table} WHERE {where} ORDER BY {key} LIMIT ?)'
+    total = 0
+
+    while True:
+        with db_conn:
+            cursor = db_conn.execute(sql, params + (chunk_rows,))
+            count = cursor.rowcount
+            cursor.close()
+        total += count
+
+        if count < chunk_rows or is_stopping(stopping):
+            return total
+
+        time.sleep(pause_seconds)
+
+def delete_raw(db_conn, before_id, cutoff_ms, chunk_rows = RETENTION_CHUNK_ROWS, pause_seconds = RETENTION_PAUSE_SECONDS, stopping = None):
+    return delete_chunked(
+        db_conn,
+        SQLITE_TABLE_NAME,
+        'id',
+        'id < ? AND time_ms <= ?',
+        (before_id, cutoff_ms),
+        chunk_rows,
+        pause_seconds,
+        stopping
+    )
+
+def clear_tables(db_conn, before_id, now_ms, chunk_rows = RETENTION_CHUNK_ROWS, pause_seconds = RETENTION_PAUSE_SECONDS, stopping = None):
+    # returns [(table, deleted rows)], raw rows from before_id on are kept whatever their age
+    cutoff_ms = get_retention_cutoff_ms(RETENTION_DAYS, now_ms)
+    totals = [(SQLITE_TABLE_NAME, delete_raw(db_conn, before_id, cutoff_ms, chunk_rows, pause_seconds, stopping))]
+
+    for table, _, retention_days in ROLLUPS:
+        if is_stopping(stopping):
+            break
+        cutoff_ms = get_retention_cutoff_ms(retention_days, now_ms)
+        totals.append((table, delete_chunked(db_conn, table, 'bucket_ms', 'bucket_ms < ?', (cutoff_ms,), chunk_rows, pause_seconds, stopping)))
+
+    return totals
+
+def vacuum_incremental(db_conn, pages = RETENTION_VACUUM_PAGES, pause_seconds = RETENTION_PAUSE_SECONDS, stopping = None):
+    # returns the number of pages handed back, needs auto_vacuum = INCREMENTAL (see init_auto_vacuum)
+    if get_pragma(db_conn, 'auto_vacuum') != 2:
+        return 0
+
+    total = 0
+    while not is_stopping(stopping):
+        free_pages = get_pragma(db_conn, 'freelist_count')
+        if free_pages == 0:
+            break
+
+        # through execute() the pragma stops after its first page, executescript runs it to the end
+        db_conn.executescript(f'PRAGMA incremental_vacuum({pages});')
+        total += min(pages, free_pages)
+
+        time.sleep(pause_seconds)
+
+    return total
+
+def get_archive_pending(db_conn):
+    # (before_id, cutoff_ms) of raw rows already in the archive but not all deleted yet, or None
+    cursor = db_conn.cursor()
+    cursor.execute(f'SELECT before_id, cutoff_ms FROM {SQLITE_ARCHIVE_PENDING_TABLE_NAME} WHERE id = 1')
+    row = cursor.fetchone()
+    cursor.close()
+
+    return tuple(row) if row is not None else None
+
+def set_archive_pending(db_conn, before_id, cutoff_ms):
+    with db_conn:
+        db_conn.execute(f"""
+            INSERT OR REPLACE INTO {SQLITE_ARCHIVE_PENDING_TABLE_NAME} (id, before_id, cutoff_ms)
+            VALUES (1, ?, ?)
+        """, (before_id, cutoff_ms))
+
+def clear_archive_pending(db_conn):
+    with db_conn:
+        db_conn.execute(f'DELETE FROM {SQLITE_ARCHIVE_PENDING_TABLE_NAME}')
+
+def clear_local(userdata):
+    print('clear_local started')
+    db_conn = userdata['db_conn']
+    stopping = userdata.get('stopping')
+    now_ms = get_since_ms(0)
+    with CLEAR_LOCAL_SECONDS.time():
+        # a run stopped or killed after archiving left rows that are in the archive already, archiving
+        # them again would write a second part file with the same rows; they are only deleted
+        pending = get_archive_pending(db_conn)
+        if pending is not None:
+            total = delete_raw(db_conn, *pending, stopping=stopping)
+            print(f'clear_local resumed total: {total}')
+            CLEAR_LOCAL_ROWS.inc(total)
+            if is_stopping(stopping):
+                print('clear_local stopped')
+                return
+            clear_archive_pending(db_conn)
+
+        # rows the export cursor has not passed yet are kept whatever their age,
+        # the others are compacted into the archive before they are deleted
+        pending_id = get_pending_id(db_conn)
+        cutoff_ms = get_retention_cutoff_ms(RETENTION_DAYS, now_ms)
+        print(f'clear_local archived: {archive_rows(db_conn, cutoff_ms, pending_id)}')
+        set_archive_pending(db_conn, pending_id, cutoff_ms)
+
+        for table, total in clear_tables(db_conn, pending_id, now_ms, stopping=stopping):
+            print(f'clear_local {table} total: {total}')
+            CLEAR_LOCAL_ROWS.inc(total)
+        if is_stopping(stopping):
+            print('clear_local stopped')
+            return
+        clear_archive_pending(db_conn)
+
+        print(f'clear_local vacuumed pages: {vacuum_incremental(db_conn, stopping=stopping)}')
+    print('clear_local completed')
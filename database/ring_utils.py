@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+from archive_utils import has_archive
+from array import array
+from constants import (
+    DEFAULT_HOST,
+    RING_BUFFER_SIZE,
+    SORTED_SENSORS_LIST,
+    SQLITE_SAMPLES_COLUMNS,
+    SQLITE_TABLE_NAME
+)
+from deadband_utils import iter_filled_chunks
+from filter_utils import SENSOR_INDEX
+import threading
+
+class RingBuffer:
+    # fixed size, one preallocated array per sensor column: memory is
+    # size * 8 bytes * (sensors + 1) plus one timestamp string per slot
+    def __init__(self, size = RING_BUFFER_SIZE, host = DEFAULT_HOST):
+        self.size = size
+        self.host = host
+        self.count = 0
+        self.head = 0
+        # no older rows exist anywhere else, in SQLite or the archive; load() finds out
+        self.complete = True
+        self.lock = threading.Lock()
+
+        self.timestamps = [None] * size
+        self.times = array('q', bytes(8 * size))
+        self.columns = [array('d', bytes(8 * size)) for _ in SORTED_SENSORS_LIST]
+
+    def append(self, row):
+        # row as built by PayloadDecoder: timestamp, time_ms, then SORTED_SENSORS_LIST
+        with self.lock:
+            head = self.head
+            self.timestamps[head] = row[0]
+            self.times[head] = row[1]
+            for index, column in enumerate(self.columns):
+                column[head] = row[index + 2]
+
+            self.head = (head + 1) % self.size
+            if self.count < self.size:
+                self.count += 1
+
+    def load(self, db_conn):
+        # prefill with the newest rows so the buffer is authoritative from startup,
+        # rows the deadband left out are filled back in
+        cols = ', '.join(SORTED_SENSORS_LIST + SQLITE_SAMPLES_COLUMNS)
+        sql = f"""
+            SELECT timestamp, time_ms, {cols} FROM {SQLITE_TABLE_NAME}
+            WHERE host = ? ORDER BY id DESC LIMIT ?
+        """
+        cursor = db_conn.cursor()
+        cursor.execute(sql, (self.host, self.size))
+        rows = cursor.fetchall()
+        cursor.close()
+
+        # rows archived and deleted from SQLite are older than anything the buffer can hold
+        self.complete = len(rows) < self.size and not has_archive(self.host)
+
+        rows.reverse()
+        for chunk in iter_filled_chunks([rows]):
+            for row in chunk:
+                self.append(row)
+
+        print(f'RingBuffer {self.host} loaded: {len(rows)}')
+
+    def covers(self, since_ms):
+        # not full yet only means every row there is when nothing older was left in SQLite or the archive
+        if self.count < self.size and self.complete:
+            return True
+        if self.count == 0:
+            return False
+
+        return self.times[(self.head - self.count) % self.size] <= since_ms
+
+    def get_positions(self, since_ms):
+        # newest first, call with the lock held
+        positions = []
+        position = self.head
+        for _ in range(self.count):
+            position = (position - 1) % self.size
+            if self.times[position] < since_ms:
+                break
+            positions.append(position)
+
+        return positions
+
+    def query(self, since_ms, cols = SORTED_SENSORS_LIST):
+        indexes = [(SENSOR_INDEX[col], col) for col in cols]
+
+        with self.lock:
+            if not self.covers(since_ms):
+                return None
+
+            rows = []
+            for position in reversed(self.get_positions(since_ms)):
+                row = {
+                    'timestamp': self.timestamps[position],
+                    'time_ms': self.times[position]
+                }
+                for index, col in indexes:
+                    row[col] = self.columns[index][position]
+                rows.append(row)
+
+        return rows
+
+    def query_tail(self, since_ms, cols = SORTED_SENSORS_LIST):
+        # whatever the buffer has from since_ms on, as (timestamp, time_ms, *cols): the rows newer than
+        # the last one in SQLite, still held by the deadband or queued in the writer
+        indexes = [SENSOR_INDEX[col] for col in cols]
+
+        with self.lock:
+            rows = []
+            for position in reversed(self.get_positions(since_ms)):
+                values = [self.columns[index][position] for index in indexes]
+                rows.append((self.timestamps[position], self.times[position], *values))
+
+        return rows
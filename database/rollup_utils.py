@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+from constants import (
+    DEFAULT_HOST,
+    ROLLUPS,
+    SORTED_SENSORS_LIST,
+    SQLITE_TABLE_NAME
+)
+import re
+
+AGGREGATES = {'avg', 'min', 'max', 'last'}
+PERCENTILE_PATTERN = re.compile(r'^p([1-9][0-9]?)$')
+
+def get_rollup_create_sql(table):
+    cols = []
+    for col in SORTED_SENSORS_LIST:
+        cols += [f'{col}__sum REAL', f'{col}__min REAL', f'{col}__max REAL', f'{col}__last REAL']
+    cols = ', '.join(cols)
+
+    sql = f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            host TEXT NOT NULL,
+            bucket_ms INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            last_ms INTEGER NOT NULL,
+            {cols},
+            PRIMARY KEY (host, bucket_ms)
+        )
+    """
+
+    return sql
+
+def get_rollup_upsert_sql(table, bucket_ms):
+    # last values come from the row numbered 1, the newest of its bucket (a bare column next to 55 min/max
+    # aggregates would come from any of them); sums and counts weigh every row by the messages it stands for
+    # (see deadband_utils.py)
+    cols = []
+    selects = []
+    updates = []
+    for col in SORTED_SENSORS_LIST:
+        cols += [f'{col}__sum', f'{col}__min', f'{col}__max', f'{col}__last']
+        selects += [f'sum({col} * samples)', f'min({col})', f'max({col})', f'max(CASE WHEN newest = 1 THEN {col} END)']
+        updates += [
+            f'{col}__sum = {col}__sum + excluded.{col}__sum',
+            f'{col}__min = min({col}__min, excluded.{col}__min)',
+            f'{col}__max = max({col}__max, excluded.{col}__max)',
+            f'{col}__last = CASE WHEN excluded.last_ms >= last_ms THEN excluded.{col}__last ELSE {col}__last END'
+        ]
+    cols = ', '.join(cols)
+    selects = ', '.join(selects)
+    updates = ',\n'.join(updates)
+
+    # the WHERE true keeps SQLite from reading ON CONFLICT as a join constraint
+    sql = f"""
+        INSERT INTO {table} (host, bucket_ms, count, last_ms, {cols})
+        SELECT host, bucket, sum(samples), max(time_ms), {selects}
+        FROM (
+            SELECT *, (time_ms / {bucket_ms}) * {bucket_ms} AS bucket, row_number() OVER (
+                PARTITION BY host, (time_ms / {bucket_ms}) * {bucket_ms} ORDER BY time_ms DESC, id DESC
+            ) AS newest
+            FROM {SQLITE_TABLE_NAME}
+            WHERE id > ?
+        )
+        WHERE true
+        GROUP BY host, bucket
+        ON CONFLICT(host, bucket_ms) DO UPDATE SET
+            count = count + excluded.count,
+            last_ms = max(last_ms, excluded.last_ms),
+            {updates}
+    """
+
+    return sql
+
+def get_rollup_last_sql(table, bucket_ms):
+    # sets the last values of every bucket whose newest raw row is still stored from that row
+    lasts = ', '.join(f'{col}__last' for col in SORTED_SENSORS_LIST)
+    newest = f"""
+        SELECT {', '.join(SORTED_SENSORS_LIST)} FROM {SQLITE_TABLE_NAME}
+        WHERE host = {table}.host AND time_ms >= {table}.bucket_ms AND time_ms < {table}.bucket_ms + {bucket_ms}
+        ORDER BY time_ms DESC, id DESC LIMIT 1
+    """
+
+    sql = f"""
+        UPDATE {table} SET ({lasts}) = ({newest})
+        WHERE bucket_ms >= (SELECT min(time_ms) FROM {SQLITE_TABLE_NAME}) - {bucket_ms} AND EXISTS ({newest})
+    """
+
+    return sql
+
+ROLLUP_UPSERT_SQLS = [get_rollup_upsert_sql(table, bucket_ms) for table, bucket_ms, _ in ROLLUPS]
+
+def update_rollups(db_conn, after_id):
+    # folds every raw row with id > after_id into the rollups, call inside the insert transaction
+    for sql in ROLLUP_UPSERT_SQLS:
+        db_conn.execute(sql, (after_id,))
+
+def get_max_id(db_conn):
+    cursor = db_conn.cursor()
+    cursor.execute(f'SELECT COALESCE(max(id), 0) FROM {SQLITE_TABLE_NAME}')
+    max_id = cursor.fetchone()[0]
+    cursor.close()
+
+    return max_id
+
+def parse_agg(agg):
+    if agg in AGGREGATES:
+        return agg, None
+
+    match = PERCENTILE_PATTERN.match(agg)
+    if match is None:
+        return None, None
+
+    return 'percentile', int(match.group(1))
+
+def get_rollup(step_ms):
+    # coarsest rollup that evenly divides the requested step
+    for table, bucket_ms, _ in sorted(ROLLUPS, key=lambda rollup: -rollup[1]):
+        if step_ms % bucket_ms == 0:
+            return table
+
+    return None
+
+def get_bucket_select(step_ms, time_col):
+    return f"""
+        ({time_col} / {step_ms}) * {step_ms} AS bucket,
+        strftime('%Y-%m-%d %H:%M:%f', ({time_col} / {step_ms}) * {step_ms} / 1000.0, 'unixepoch') AS timestamp
+    """
+
+def get_aggregated_sql(step_ms, agg, cols):
+    table = get_rollup(step_ms)
+
+    if table is None:
+        time_col = 'time_ms'
+        table = SQLITE_TABLE_NAME
+        if agg == 'last':
+            selects = ['max(time_ms)'] + cols
+        elif agg == 'avg':
+            selects = [f'sum({col} * samples) / sum(samples) AS {col}' for col in cols]
+        else:
+            selects = [f'{agg}({col}) AS {col}' for col in cols]
+    else:
+        time_col = 'bucket_ms'
+        if agg == 'avg':
+            selects = [f'sum({col}__sum) / sum(count) AS {col}' for col in cols]
+        elif agg == 'last':
+            selects = ['max(bucket_ms)'] + [f'{col}__last AS {col}' for col in cols]
+        else:
+            selects = [f'{agg}({col}__{agg}) AS {col}' for col in cols]
+
+    selects = ', '.join(selects)
+    sql = f"""
+        SELECT {get_bucket_select(step_ms, time_col)}, {selects}
+        FROM {table}
+        WHERE host = ? AND {time_col} >= ?
+        GROUP BY bucket
+        ORDER BY bucket
+    """
+
+    return sql
+
+def get_percentile(values, pct, weights = None):
+    # nearest-rank, a value with weight n counts as n values
+    if weights is None:
+        values = sorted(values)
+        index = max(0, -(-pct * len(values) // 100) - 1)
+
+        return values[index]
+
+    pairs = sorted(zip(values, weights))
+    rank = max(1, -(-pct * sum(weights) // 100))
+    for value, weight in pairs:
+        rank -= weight
+        if rank <= 0:
+            return value
+
+def query_percentile(db_conn, since_ms, step_ms, pct, cols, host):
+    sql = f"""
+        SELECT {get_bucket_select(step_ms, 'time_ms')}, samples, {', '.join(cols)}
+        FROM {SQLITE_TABLE_NAME}
+        WHERE host = ? AND time_ms >= ?
+        ORDER BY time_ms
+    """
+    cursor = db_conn.cursor()
+    cursor.execute(sql, (host, since_ms))
+
+    rows = []
+    bucket = None
+    bucket_rows = []
+    for row in cursor:
+        if row[0] != bucket and len(bucket_rows) > 0:
+            rows.append(get_percentile_row(bucket_rows, pct, cols))
+            bucket_rows = []
+        bucket = row[0]
+        bucket_rows.append(row)
+    if len(bucket_rows) > 0:
+        rows.append(get_percentile_row(bucket_rows, pct, cols))
+    cursor.close()
+
+    return rows
+
+def get_percentile_row(bucket_rows, pct, cols):
+    first = bucket_rows[0]
+    row = {'timestamp': first[1], 'time_ms': first[0]}
+    weights = [each[2] for each in bucket_rows]
+    if max(weights) == 1:
+        weights = None
+
+    for index, col in enumerate(cols):
+        row[col] = get_percentile([each[index + 3] for each in bucket_rows], pct, weights)
+
+    return row
+
+def query_aggregated(db_conn, since_ms, step_ms, agg, cols = SORTED_SENSORS_LIST, host = DEFAULT_HOST):
+    agg, pct = parse_agg(agg)
+
+    # buckets are aligned to the epoch, start at the one containing since_ms
+    since_ms = (since_ms // step_ms) * step_ms
+
+    if agg == 'percentile':
+        return query_percentile(db_conn, since_ms, step_ms, pct, cols, host)
+
+    cursor = db_conn.cursor()
+    cursor.execute(get_aggregated_sql(step_ms, agg, cols), (host, since_ms))
+
+    rows = []
+    for row in cursor:
+        values = row[3:] if agg == 'last' else row[2:]
+        rows.append({
+            'timestamp': row[1],
+            'time_ms': row[0],
+            **dict(zip(cols, values))
+        })
+    cursor.close()
+
+    return rows
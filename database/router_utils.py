@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+
+from constants import DEVICES
+from decoder_utils import PayloadDecoder
+
+class TopicRouter:
+    # one PayloadDecoder (and so one compiled insert) per device topic, looked up per message
+    def __init__(self, devices = DEVICES):
+        self.decoders = {topic: PayloadDecoder(cols, host) for topic, (host, cols) in devices.items()}
+        self.hosts = {decoder.host.lower(): decoder.host for decoder in self.decoders.values()}
+
+    def get(self, topic):
+        return self.decoders.get(topic)
+
+    def get_host(self, host):
+        # case-insensitive, None for a host no topic publishes
+        return self.hosts.get(host.lower())
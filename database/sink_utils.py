@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+from constants import (
+    DATABASE_NAME,
+    EXPORT_FILE,
+    EXPORT_GZIP_LEVEL,
+    EXPORT_MAX_BYTES_PER_WRITE,
+    EXPORT_RECORDS_PER_WRITE,
+    EXPORT_SINK,
+    EXPORT_TOKEN,
+    EXPORT_URL,
+    MAX_RECORDS_PER_WRITE,
+    TABLE_NAME
+)
+from urllib.parse import urlsplit
+import gzip
+import http.client
+import json
+import threading
+
+# an export sink takes batches of Timestream-shaped records (see export_utils.RecordEncoder and finish_batch):
+#   write(records, common_attributes) returns once every record is stored, or raises
+#   ThrottlingError (retried after a backoff), RejectedRecordsError (final: the rest of the batch
+#   is stored, the rejected records are dropped) or any other exception (the whole batch is retried)
+# records stay in that shape in the outbox too, so a parked batch replays through whichever sink is configured
+
+class ThrottlingError(Exception):
+    pass
+
+class RejectedRecordsError(Exception):
+    # rejected: [{'RecordIndex': index, 'Reason': reason, 'ExistingVersion': version (already stored)}]
+    def __init__(self, rejected):
+        super().__init__(f'{len(rejected)} records rejected')
+        self.rejected = rejected
+
+def print_rejected_records(rejected, limit = 10):
+    # a whole rejected batch is thousands of records with the same reason
+    if len(rejected) > limit:
+        print(f'Rejected records: {len(rejected)}, first {limit}:')
+    for rr in rejected[:limit]:
+        print(f"Rejected Index {rr['RecordIndex']}: {rr['Reason']}")
+        if 'ExistingVersion' in rr:
+            print(f"Rejected record existing version: {rr['ExistingVersion']}")
+
+def merge_attributes(record, common_attributes):
+    # a record with the attributes it shares with the rest of its batch filled back in
+    merged = dict(common_attributes)
+    merged.update(record)
+    merged['Dimensions'] = common_attributes.get('Dimensions', []) + record.get('Dimensions', [])
+
+    return merged
+
+class TimestreamSink:
+    # WriteRecords is capped at 100 records, records are small enough that the count is what binds
+    max_bytes = None
+    max_records = MAX_RECORDS_PER_WRITE
+
+    def __init__(self, write_client = None):
+        self.name = f'{DATABASE_NAME}.{TABLE_NAME}'
+        self.write_client = write_client
+
+    def write(self, records, common_attributes):
+        write_client = self.write_client
+        if write_client is None:
+            # boto3 is only needed when exporting to Timestream
+            from aws_utils import get_aws_write_client
+            write_client = self.write_client = get_aws_write_client()
+
+        try:
+            result = write_client.write_records(
+                DatabaseName=DATABASE_NAME,
+                TableName=TABLE_NAME,
+                Records=records,
+                CommonAttributes=common_attributes
+            )
+        except write_client.exceptions.RejectedRecordsException as err:
+            raise RejectedRecordsError(err.response['RejectedRecords'])
+        except write_client.exceptions.ThrottlingException as err:
+            raise ThrottlingError(str(err))
+
+        print(f"write_records status: [{result['ResponseMetadata']['HTTPStatusCode']}]")
+
+class FileSink:
+    # JSON lines, one self-contained record per line; a local stand-in for the remote store
+    max_bytes = EXPORT_MAX_BYTES_PER_WRITE
+    max_records = EXPORT_RECORDS_PER_WRITE
+
+    def __init__(self, path = EXPORT_FILE):
+        self.name = f'file:{path}'
+        self.path = path
+        self.lock = threading.Lock()
+
+    def write(self, records, common_attributes):
+        lines = ''.join(json.dumps(merge_attributes(record, common_attributes)) + '\n' for record in records)
+
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(lines)
+
+def escape_tag(value):
+    return value.replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+def format_line(record, common_attributes):
+    # InfluxDB line protocol: <measurement>,<tags> <fields> <time in ms>
+    record = merge_attributes(record, common_attributes)
+
+    fields = []
+    for measure in record.get('MeasureValues', []):
+        value = measure['Value']
+        if measure['Type'] == 'BIGINT':
+            value += 'i'
+        elif measure['Type'] == 'VARCHAR':
+            value = json.dumps(value)
+        fields.append(f"{escape_tag(measure['Name'])}={value}")
+
+    if len(fields) == 0:
+        return None
+
+    tags = ''.join(f",{escape_tag(d['Name'])}={escape_tag(d['Value'])}" for d in record['Dimensions'])
+
+    return f"{TABLE_NAME}{tags} {','.join(fields)} {record['Time']}"
+
+class LineProtocolSink:
+    # POSTs gzipped line protocol to an InfluxDB-compatible write endpoint, e.g.
+    # http://influxdb:8086/api/v2/write?bucket=homestats&precision=ms; every upload worker
+    # thread keeps its own connection alive between batches
+    max_bytes = EXPORT_MAX_BYTES_PER_WRITE
+    max_records = EXPORT_RECORDS_PER_WRITE
+
+    def __init__(self, url = EXPORT_URL, token = EXPORT_TOKEN, gzip_level = EXPORT_GZIP_LEVEL, keep_alive = True):
+        parts = urlsplit(url)
+        self.name = f'line:{url}'
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.path = parts.path + ('?' + parts.query if parts.query else '')
+        self.headers = {'Content-Type': 'text/plain; charset=utf-8'}
+        if token:
+            self.headers['Authorization'] = f'Token {token}'
+        if gzip_level > 0:
+            self.headers['Content-Encoding'] = 'gzip'
+        self.gzip_level = gzip_level
+        self.keep_alive = keep_alive
+        self.local = threading.local()
+
+    def write(self, records, common_attributes):
+        lines = filter(None, (format_line(record, common_attributes) for record in records))
+        body = '\n'.join(lines).encode('utf-8')
+        if self.gzip_level > 0:
+            body = gzip.compress(body, self.gzip_level)
+
+        status, reason = self.post(body)
+
+        if status in (429, 503):
+            raise ThrottlingError(f'{status} {reason}')
+        if 400 <= status < 500 and status != 408:
+            # bad points (400), a body too large (413) or points outside the retention (422) fail again
+            # however often they are sent; the server does not say which lines, so the batch is rejected
+            raise RejectedRecordsError([{'RecordIndex': index, 'Reason': f'{status} {reason}'} for index in range(len(records))])
+        if status >= 300:
+            raise Exception(f'line protocol write failed: {status} {reason}')
+
+    def post(self, body):
+        conn = getattr(self.local, 'conn', None)
+        reused = conn is not None
+        if conn is None:
+            conn = self.connection_class(self.netloc, timeout=30)
+
+        try:
+            conn.request('POST', self.path, body, self.headers)
+            response = conn.getresponse()
+            reason = response.read().decode('utf-8', 'replace') or response.reason
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self.local.conn = None
+            if not reused:
+                raise
+            # the server closed the idle connection; writing the same points twice is harmless
+            return self.post(body)
+
+        if self.keep_alive and not response.will_close:
+            self.local.conn = conn
+        else:
+            conn.close()
+            self.local.conn = None
+
+        return response.status, reason
+
+SINKS = {
+    'file': FileSink,
+    'line': LineProtocolSink,
+    'timestream': TimestreamSink
+}
+SINK = None
+SINK_LOCK = threading.Lock()
+
+def get_sink():
+    # the configured sink, shared for the process lifetime like the boto3 client it may wrap
+    global SINK
+
+    with SINK_LOCK:
+        if SINK is None:
+            if EXPORT_SINK not in SINKS:
+                raise ValueError(f'unknown EXPORT_SINK: {EXPORT_SINK}')
+            SINK = SINKS[EXPORT_SINK]()
+
+    return SINK
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+from bisect import bisect_left
+from constants import DATABASE_FILE
+import os
+import threading
+import time
+
+# minimal Prometheus text exposition, no client library needed;
+# every metric registers itself here in creation order
+REGISTRY = []
+REGISTRY_LOCK = threading.Lock()
+SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def register(metric):
+    # one series per name and labels: registering the same one again (init_userdata
+    # called once more, a job added twice) replaces it instead of duplicating it
+    with REGISTRY_LOCK:
+        for index, each in enumerate(REGISTRY):
+            if each.name == metric.name and each.labels == metric.labels:
+                REGISTRY[index] = metric
+                return
+        REGISTRY.append(metric)
+
+def format_labels(labels, extra = None):
+    items = list(labels.items()) + ([extra] if extra is not None else [])
+    if len(items) == 0:
+        return ''
+
+    return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels = {}):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+        self.lock = threading.Lock()
+        register(self)
+
+    def inc(self, amount = 1):
+        with self.lock:
+            self.value += amount
+
+    def render(self):
+        return [f'{self.name}{format_labels(self.labels)} {self.value}']
+
+class Gauge:
+    # read at scrape time from func(), nothing to update on the hot path;
+    # kind = 'counter' for totals another component already keeps
+    def __init__(self, name, help, func, labels = {}, kind = 'gauge'):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.func = func
+        self.kind = kind
+        register(self)
+
+    def render(self):
+        try:
+            value = self.func()
+        except Exception:
+            return []
+
+        return [f'{self.name}{format_labels(self.labels)} {value}']
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels = {}, buckets = SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.lock = threading.Lock()
+        register(self)
+
+    def observe(self, value):
+        # le buckets: the first bound >= value
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return Timer(self)
+
+    def render(self):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{format_labels(self.labels, ("le", bound))} {cumulative}')
+        lines.append(f'{self.name}_sum{format_labels(self.labels)} {total}')
+        lines.append(f'{self.name}_count{format_labels(self.labels)} {cumulative}')
+
+        return lines
+
+class Timer:
+    # with HISTOGRAM.time(): ...
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+def iter_timed(iterable, histogram):
+    # observes the time until a generator (a streamed response) is exhausted or closed
+    started = time.perf_counter()
+    try:
+        yield from iterable
+    finally:
+        histogram.observe(time.perf_counter() - started)
+
+def render():
+    # a family's samples must be one contiguous group, whatever order its series were created in
+    with REGISTRY_LOCK:
+        families = {}
+        for metric in REGISTRY:
+            families.setdefault(metric.name, []).append(metric)
+
+    lines = []
+    for name, metrics in families.items():
+        lines.append(f'# HELP {name} {metrics[0].help}')
+        lines.append(f'# TYPE {name} {metrics[0].kind}')
+        for metric in metrics:
+            lines += metric.render()
+
+    return '\n'.join(lines) + '\n'
+
+def get_db_bytes(db_file = DATABASE_FILE):
+    return sum(os.path.getsize(db_file + suffix) for suffix in ['', '-wal'] if os.path.exists(db_file + suffix))
+
+MESSAGES = Counter('homestats_messages_total', 'MQTT messages received by on_message')
+MESSAGE_SECONDS = Histogram('homestats_message_seconds', 'Time to decode a message and hand its row to the writer')
+INSERT_ROWS = Counter('homestats_insert_rows_total', 'Rows inserted by the batch writer')
+INSERT_SECONDS = Histogram('homestats_insert_seconds', 'Batch writer insert, rollup update and commit time per flush')
+QUERY_SECONDS = {
+    source: Histogram('homestats_query_seconds', '/metrics query and serialization time', {'source': source})
+    for source in ['memory', 'sqlite', 'aggregated']
+}
+EXPORT_BATCH_SECONDS = Histogram('homestats_export_batch_seconds', 'write_records time per batch, retries included')
+EXPORT_RECORDS = {
+    result: Counter('homestats_export_records_total', 'Timestream records by outcome', {'result': result})
+    for result in ['written', 'rejected', 'failed']
+}
+EXPORT_THROTTLED = Counter('homestats_export_throttled_total', 'Throttled WriteRecords calls')
+CLEAR_LOCAL_SECONDS = Histogram('homestats_clear_local_seconds', 'clear_local run time')
+CLEAR_LOCAL_ROWS = Counter('homestats_clear_local_rows_total', 'Rows deleted by clear_local')
+DB_BYTES = Gauge('homestats_db_bytes', 'SQLite database file size, WAL included', get_db_bytes)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+from constants import (
+    MESSAGE_QUEUE_SIZE,
+    MESSAGE_WORKERS
+)
+import queue
+import threading
+import zlib
+
+_STOP = object()
+
+class MessageWorkers:
+    # handler(userdata, topic, payload) runs on one of the worker threads; every worker has its own
+    # bounded queue and a topic always maps to the same worker, so per-topic order is kept
+    def __init__(self, handler, userdata, workers = MESSAGE_WORKERS, queue_size = MESSAGE_QUEUE_SIZE):
+        self.handler = handler
+        self.userdata = userdata
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.threads = [
+            threading.Thread(target=self._run, args=(index,), name=f'message-worker-{index}', daemon=True)
+            for index in range(workers)
+        ]
+
+        # one slot per worker, only that worker writes it
+        self.processed = [0] * workers
+        self.errors = [0] * workers
+        self.dropped = 0
+        self.max_depth = 0
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, topic, payload):
+        # called from the paho network thread: never blocks, drops the message when the worker is behind
+        worker_queue = self.queues[zlib.crc32(topic.encode('utf-8')) % len(self.queues)]
+
+        try:
+            worker_queue.put_nowait((topic, payload))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f'MessageWorkers queue full, dropped: {self.dropped}')
+            return
+
+        depth = worker_queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def stop(self):
+        # handles everything already queued, then returns
+        for worker_queue in self.queues:
+            worker_queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+
+    def get_stats(self):
+        return {
+            'depth': sum(worker_queue.qsize() for worker_queue in self.queues),
+            'max_depth': self.max_depth,
+            'dropped': self.dropped,
+            'processed': sum(self.processed),
+            'errors': sum(self.errors)
+        }
+
+    def _run(self, index):
+        worker_queue = self.queues[index]
+
+        while True:
+            item = worker_queue.get()
+            if item is _STOP:
+                return
+
+            try:
+                self.handler(self.userdata, *item)
+                self.processed[index] += 1
+            except Exception as err:
+                self.errors[index] += 1
+                print(f'MessageWorkers error on topic "{item[0]}": {err}')
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+from constants import (
+    DATABASE_FILE,
+    WRITER_BATCH_SIZE,
+    WRITER_FLUSH_SECONDS,
+    WRITER_QUEUE_SIZE,
+    WRITER_RETRIES,
+    WRITER_RETRY_SECONDS
+)
+from db_utils import get_db_conn
+from rollup_utils import (
+    get_max_id,
+    update_rollups
+)
+from stats_utils import (
+    INSERT_ROWS,
+    INSERT_SECONDS
+)
+import queue
+import sqlite3
+import threading
+import time
+
+_STOP = object()
+
+class BatchWriter(threading.Thread):
+    def __init__(
+        self,
+        sql,
+        batch_size = WRITER_BATCH_SIZE,
+        flush_seconds = WRITER_FLUSH_SECONDS,
+        queue_size = WRITER_QUEUE_SIZE,
+        db_file = DATABASE_FILE
+    ):
+        super().__init__(name='batch-writer', daemon=True)
+
+        self.sql = sql
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.db_file = db_file
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.dropped = 0
+        self.written = 0
+
+    def put(self, row, sql = None):
+        # never block the caller (the paho network thread), count drops instead;
+        # sql is the device insert statement, self.sql when omitted
+        try:
+            self.queue.put_nowait((sql or self.sql, row))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                print(f'BatchWriter queue full, dropped: {self.dropped}')
+
+    def stop(self):
+        self.queue.put(_STOP)
+        self.join()
+
+    def get_stats(self):
+        return {
+            'depth': self.queue.qsize(),
+            'dropped': self.dropped,
+            'written': self.written
+        }
+
+    def run(self):
+        db_conn = get_db_conn(db_file=self.db_file)
+
+        stopping = False
+        while not stopping:
+            rows, stopping = self._collect()
+
+            if len(rows) > 0:
+                self._flush(db_conn, rows)
+
+        db_conn.close()
+
+    def _collect(self):
+        rows = []
+
+        first = self.queue.get()
+        if first is _STOP:
+            return rows, True
+        rows.append(first)
+
+        deadline = time.monotonic() + self.flush_seconds
+        while len(rows) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+
+            try:
+                row = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if row is _STOP:
+                return rows, True
+            rows.append(row)
+
+        return rows, False
+
+    def _flush(self, db_conn, rows):
+        # rows of every device share the transaction, one executemany per device statement
+        groups = {}
+        for sql, row in rows:
+            groups.setdefault(sql, []).append(row)
+
+        delay = WRITER_RETRY_SECONDS
+        for attempt in range(WRITER_RETRIES + 1):
+            try:
+                with INSERT_SECONDS.time(), db_conn:
+                    after_id = get_max_id(db_conn)
+                    for sql, group in groups.items():
+                        db_conn.executemany(sql, group)
+                    update_rollups(db_conn, after_id)
+                self.written += len(rows)
+                INSERT_ROWS.inc(len(rows))
+                return
+            except sqlite3.OperationalError as err:
+                # locked or busy: the transaction rolled back, the same rows go again
+                if attempt == WRITER_RETRIES:
+                    print(f'BatchWriter error: {err}. Lost rows: {len(rows)}')
+                    break
+                print(f'BatchWriter error: {err}. Retrying {len(rows)} rows in {delay}s')
+                time.sleep(delay)
+                delay *= 2
+            except Exception as err:
+                print(f'BatchWriter error: {err}. Lost rows: {len(rows)}')
+                break
+
+        self.dropped += len(rows)